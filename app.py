@@ -23,9 +23,9 @@ stack_env = {
     "region": region
 }
 
-identity_stack = IdentityStack(app, "IdentityStack", env=stack_env)
-config_stack = ConfigStack(app, "ConfigStack", env=stack_env)
 data_stack = DataStack(app, "DataStack", env=stack_env)
+identity_stack = IdentityStack(app, "IdentityStack", data_stack=data_stack, env=stack_env)
+config_stack = ConfigStack(app, "ConfigStack", env=stack_env)
 
 backend_stack = BackendStack(app, "BackendStack",
     identity_stack=identity_stack,
@@ -5,87 +5,297 @@ import json
 import os
 import re
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
-from jose import jwk, jwt
-from jose.utils import base64url_decode
-
-from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
 from botocore.exceptions import ClientError
 
-logger = Logger()
+import http_client
+from jwks_cache import JwksCache
+from phase_timer import PhaseTimer
+from rate_limiter import AppConfigPoller, SharedWindowCounter, TenantRateLimiter, tenant_limits
+from sampled_logging import get_logger
+from tenant_cache import TenantMetadataCache
+from token_cache import TokenCache
+from verifiers import InvalidToken, ParsedToken, get_verifier
+
+logger = get_logger()
+metrics = Metrics(namespace=os.environ.get('METRICS_NAMESPACE', 'SaaSPricingTiers'), service='authorizer')
 
 # Constants
 REGION = os.environ['AWS_REGION']
 USER_POOL_ID = os.environ['USER_POOL_ID']
 USER_POOL_CLIENT_ID = os.environ['USER_POOL_CLIENT_ID']
 TENANT_METADATA_TABLE_NAME = os.environ['TENANT_METADATA_TABLE_NAME']
-
-# AWS service clients
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-
-tenant_metadata_table = dynamodb.Table(TENANT_METADATA_TABLE_NAME)
-
+JWKS_URL = os.environ.get('JWKS_URL') or 'https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json'.format(REGION, USER_POOL_ID)
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 3600))
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+NEGATIVE_TOKEN_CACHE_SIZE = int(os.environ.get('NEGATIVE_TOKEN_CACHE_SIZE', 128))
+NEGATIVE_TOKEN_CACHE_TTL = int(os.environ.get('NEGATIVE_TOKEN_CACHE_TTL', 60))
+TENANT_CACHE_SIZE = int(os.environ.get('TENANT_CACHE_SIZE', 1024))
+TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', 300))
+NEGATIVE_TENANT_CACHE_TTL = int(os.environ.get('NEGATIVE_TENANT_CACHE_TTL', 30))
+AUTHORIZER_IO_WORKERS = int(os.environ.get('AUTHORIZER_IO_WORKERS', 2))
+# signature verification backend, 'jose' (python-jose) or 'rsa' (cryptography)
+JWT_VERIFIER = os.environ.get('JWT_VERIFIER', 'jose')
+# publish phase timings at 1 second instead of 1 minute resolution, high resolution metrics cost more
+METRICS_HIGH_RESOLUTION = os.environ.get('METRICS_HIGH_RESOLUTION', 'false').lower() == 'true'
+# trust the tenant claims added to the ID token by the pre token generation trigger instead
+# of reading the tenant metadata table, tokens without the claims are still looked up
+TRUST_TOKEN_CLAIMS = os.environ.get('TRUST_TOKEN_CLAIMS', 'false').lower() == 'true'
+# claims added by the pre token generation trigger
+TENANT_CLAIMS = ('tenant_name', 'tenant_tier', 'fullname')
+# per tenant token buckets, with the limits of each tier read from an AppConfig profile.
+# A throttled request is denied, so API Gateway must not cache the authorizer responses
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', 'false').lower() == 'true'
+CONFIG_APP_NAME = os.environ.get('CONFIG_APP_NAME')
+CONFIG_ENV_NAME = os.environ.get('CONFIG_ENV_NAME')
+RATE_LIMITS_PROFILE_NAME = os.environ.get('RATE_LIMITS_PROFILE_NAME', 'rate-limits')
+RATE_LIMITS_POLL_INTERVAL = int(os.environ.get('RATE_LIMITS_POLL_INTERVAL', 30))
+RATE_LIMITER_SIZE = int(os.environ.get('RATE_LIMITER_SIZE', 4096))
+# table of the request counts shared by all execution environments, unset to limit each one on its own
+RATE_LIMIT_TABLE_NAME = os.environ.get('RATE_LIMIT_TABLE_NAME')
+RATE_LIMIT_WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', 60))
+RATE_LIMIT_SYNC_INTERVAL = float(os.environ.get('RATE_LIMIT_SYNC_INTERVAL', 2))
+# API key of the usage plan of each tier, as a JSON object, returned as the usage identifier key
+USAGE_PLAN_KEYS = json.loads(os.environ.get('USAGE_PLAN_KEYS') or '{}')
+# fetch the JWKS and set up the DynamoDB client during the INIT phase instead of the first request
+PREWARM_ON_INIT = os.environ.get('PREWARM_ON_INIT', 'false').lower() == 'true'
+
+# AWS service clients, boto3 is only imported when the table is first needed
+tenant_metadata_table = None
+
+def _get_tenant_metadata_table():
+    global tenant_metadata_table
+    if tenant_metadata_table is None:
+        import boto3
+        dynamodb = boto3.resource('dynamodb', region_name=REGION)
+        tenant_metadata_table = dynamodb.Table(TENANT_METADATA_TABLE_NAME)
+    return tenant_metadata_table
+
+verifier = get_verifier(JWT_VERIFIER)
+
+# JWKS and verification decisions are cached across warm invocations of this execution environment
+jwks_cache = JwksCache(
+    JWKS_URL,
+    ttl=JWKS_CACHE_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+    key_factory=verifier.prepare_key
+)
+token_cache = TokenCache(
+    maxsize=TOKEN_CACHE_SIZE,
+    negative_maxsize=NEGATIVE_TOKEN_CACHE_SIZE,
+    negative_ttl=NEGATIVE_TOKEN_CACHE_TTL
+)
+
+def _get_tenant_item(tenant_id):
+    tenant_details = _get_tenant_metadata_table().get_item(
+        Key={
+            'tenant_id': tenant_id
+        }
+    )
+    return tenant_details.get('Item')
+
+# tenant metadata rarely changes, so it is read through a cache in front of DynamoDB
+tenant_cache = TenantMetadataCache(
+    _get_tenant_item,
+    maxsize=TENANT_CACHE_SIZE,
+    ttl=TENANT_CACHE_TTL,
+    negative_ttl=NEGATIVE_TENANT_CACHE_TTL
+)
+
+# runs the JWKS fetch and the tenant lookup concurrently when both need I/O
+io_executor = ThreadPoolExecutor(max_workers=AUTHORIZER_IO_WORKERS)
+
+rate_limit_table = None
+
+def _get_rate_limit_table():
+    global rate_limit_table
+    if rate_limit_table is None:
+        import boto3
+        dynamodb = boto3.resource('dynamodb', region_name=REGION)
+        rate_limit_table = dynamodb.Table(RATE_LIMIT_TABLE_NAME)
+    return rate_limit_table
+
+def _add_request_count(counter_id, count, expires_at):
+    response = _get_rate_limit_table().update_item(
+        Key={'counter_id': counter_id},
+        UpdateExpression='ADD request_count :count SET expires_at = :expires_at',
+        ExpressionAttributeValues={':count': count, ':expires_at': expires_at},
+        ReturnValues='UPDATED_NEW'
+    )
+    return int(response['Attributes']['request_count'])
+
+def _appconfig_data_client():
+    import boto3
+    return boto3.client('appconfigdata', region_name=REGION)
+
+# the limits are polled in the background, the buckets live across warm invocations
+if RATE_LIMITS_ENABLED:
+    rate_limits_config = AppConfigPoller(
+        _appconfig_data_client,
+        application=CONFIG_APP_NAME,
+        environment=CONFIG_ENV_NAME,
+        profile=RATE_LIMITS_PROFILE_NAME,
+        executor=io_executor,
+        poll_interval=RATE_LIMITS_POLL_INTERVAL
+    )
+    rate_limiter = TenantRateLimiter(
+        maxsize=RATE_LIMITER_SIZE,
+        shared=SharedWindowCounter(
+            _add_request_count,
+            executor=io_executor,
+            window=RATE_LIMIT_WINDOW,
+            sync_interval=RATE_LIMIT_SYNC_INTERVAL,
+            maxsize=RATE_LIMITER_SIZE
+        ) if RATE_LIMIT_TABLE_NAME else None
+    )
+else:
+    rate_limits_config = None
+    rate_limiter = None
+
+def invalidate_tenant(tenant_id):
+    """Drops the cached metadata of a tenant in this execution environment. Other warm
+    environments pick the change up once their entry expires (TENANT_CACHE_TTL)."""
+    tenant_cache.invalidate(tenant_id)
+
+def prewarm():
+    """Loads the modules, keys and connections the first request needs. Failures are
+    logged only, the request path fetches whatever is still missing."""
+    try:
+        for key in jwks_cache.get_keys():
+            jwks_cache.get_public_key(key['kid'])
+        # opens the connection to DynamoDB, the item does not exist
+        _get_tenant_metadata_table().get_item(Key={'tenant_id': '__prewarm__'})
+        if rate_limits_config is not None:
+            rate_limits_config.get()
+    except Exception as e:
+        logger.warning("Prewarm failed: %s", e)
+
+if PREWARM_ON_INIT:
+    prewarm()
+
+@metrics.log_metrics
 def lambda_handler(event, context):
+    #every phase of the authorization is timed, and the timings are emitted as
+    #EMF metrics whether the request is allowed or denied
+    logger.start_invocation()
+    timer = PhaseTimer()
+    timer.dimension('Tier', 'none')
+    try:
+        authResponse = authorize(event, timer)
+        timer.count('Throttled' if authResponse['context'].get('throttled') else 'Allowed')
+        return authResponse
+    except Exception:
+        timer.count('Denied')
+        raise
+    finally:
+        timer.emit(metrics, high_resolution=METRICS_HIGH_RESOLUTION)
+
+def authorize(event, timer):
     
     #get JWT token after Bearer from authorization
     token = event['authorizationToken'].split(" ")
     if (token[0] != 'Bearer'):
         raise Exception('Authorization header should have a format Bearer <JWT> Token')
-    jwt_bearer_token = token[1]
-    logger.info("Method ARN: " + event['methodArn'])
+    logger.info("Method ARN: %s", event['methodArn'])
+    logger.debug(lambda: {'http_connections': http_client.stats()})
+
+    #the token is split and decoded once, every check below reads the parsed token
+    with timer.phase('Precheck'):
+        try:
+            jwt_bearer_token = ParsedToken(token[1])
+        except InvalidToken as e:
+            logger.info("%s", e)
+            raise Exception('Unauthorized')
     
-    #only to get tenant id to get user pool info
-    unauthorized_claims = jwt.get_unverified_claims(jwt_bearer_token)
-    logger.info(unauthorized_claims)
-
-    try:
-        #get tenant user pool and app client to validate jwt token against
-        tenant_details = tenant_metadata_table.get_item( 
-            Key ={
-                'tenant_id': unauthorized_claims['custom:tenant_id']
-            }
-        )
-        logger.info(tenant_details)
-        tenant_name = tenant_details['Item']['tenant_name']
-        tenant_tier = tenant_details['Item']['tenant_tier']
-        fullname = tenant_details['Item']['fullname']
-    except ClientError as e:
-        logger.error(e)
-        raise Exception('Unauthorized')
-
-    #get keys for tenant user pool to validate
-    keys_url = 'https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json'.format(REGION, USER_POOL_ID)
-    response = requests.get(keys_url, timeout=3)
-    keys = json.loads(response.text)['keys']
+        #cheap structural and expiry checks reject bad tokens before any I/O
+        if (precheckJWT(jwt_bearer_token, USER_POOL_CLIENT_ID) == False):
+            logger.error('Unauthorized')
+            raise Exception('Unauthorized')
+    unauthorized_claims = jwt_bearer_token.claims
+    logger.debug(unauthorized_claims)
+
+    tenant_from_claims = TRUST_TOKEN_CLAIMS and _has_tenant_claims(unauthorized_claims)
+    if tenant_from_claims:
+        #the tenant details are signed claims of the token, they are trusted
+        #once the signature is verified and the table is not read
+        timer.dimension('JwksCache', 'refresh' if jwks_cache.needs_refresh(jwt_bearer_token.header['kid']) else 'hit')
+        timer.dimension('TenantCache', 'claims')
+        response = validateJWT(jwt_bearer_token, USER_POOL_CLIENT_ID, jwks_cache, timer)
+        tenant, tenant_error = None, None
+    elif jwks_cache.needs_refresh(jwt_bearer_token.header['kid']):
+        #the key set must be fetched, so authenticate against cognito user pool
+        #while the tenant details are read, end-to-end latency is the slower of the two
+        timer.dimension('JwksCache', 'refresh')
+        response_future = io_executor.submit(validateJWT, jwt_bearer_token, USER_POOL_CLIENT_ID, jwks_cache, timer)
+        tenant, tenant_error = _lookup_tenant(unauthorized_claims['custom:tenant_id'], timer)
+        response = response_future.result()
+    else:
+        #authenticate against cognito user pool using its cached keys, then
+        #only read the tenant details for tokens that passed verification
+        timer.dimension('JwksCache', 'hit')
+        response = validateJWT(jwt_bearer_token, USER_POOL_CLIENT_ID, jwks_cache, timer)
+        if (response == False):
+            logger.error('Unauthorized')
+            raise Exception('Unauthorized')
+        tenant, tenant_error = _lookup_tenant(response['custom:tenant_id'], timer)
 
-    #authenticate against cognito user pool using the key
-    response = validateJWT(jwt_bearer_token, USER_POOL_CLIENT_ID, keys)
-    
     #get authenticated claims
     if (response == False):
         logger.error('Unauthorized')
         raise Exception('Unauthorized')
     else:
-        logger.info(response)
         principal_id = response["sub"]
         username = response["cognito:username"]
         tenant_id = response["custom:tenant_id"]
-    
-    tmp = event['methodArn'].split(':')
-    api_gateway_arn_tmp = tmp[5].split('/')
-    aws_account_id = tmp[4]    
-    
-    policy = AuthPolicy(principal_id, aws_account_id)
-    policy.restApiId = api_gateway_arn_tmp[0]
-    policy.region = tmp[3]
-    policy.stage = api_gateway_arn_tmp[1]
+        logger.set_tenant(tenant_id)
+        logger.debug(response)
 
-    #roles are not fine-grained enough to allow selectively
-    policy.allowAllMethods()        
+    if tenant_from_claims:
+        tenant_name = response['tenant_name']
+        tenant_tier = response['tenant_tier']
+        fullname = response['fullname']
+    else:
+        if tenant_error is not None:
+            logger.error("Unable to read tenant metadata: %s", tenant_error)
+            raise Exception('Unauthorized')
+        if tenant is None:
+            logger.error('Tenant not found')
+            raise Exception('Unauthorized')
+        tenant_name = tenant.tenant_name
+        tenant_tier = tenant.tenant_tier
+        fullname = tenant.fullname
+    timer.dimension('Tier', tenant_tier)
+
+    #over the limit of its tier, the tenant is denied before any backend function runs
+    throttled = rate_limiter is not None and not _allow_request(tenant_id, tenant_tier, timer)
+    if throttled:
+        logger.warning("Tenant %s exceeded the rate limit of tier %s", tenant_id, tenant_tier)
     
-    authResponse = policy.build()
+    with timer.phase('PolicyBuild'):
+        tmp = event['methodArn'].split(':')
+        api_gateway_arn_tmp = tmp[5].split('/')
+        aws_account_id = tmp[4]    
+        
+        policy = AuthPolicy(principal_id, aws_account_id)
+        policy.restApiId = api_gateway_arn_tmp[0]
+        policy.region = tmp[3]
+        policy.stage = api_gateway_arn_tmp[1]
+
+        #roles are not fine-grained enough to allow selectively
+        if throttled:
+            policy.denyAllMethods()
+        else:
+            policy.allowAllMethods()
+        
+        authResponse = policy.build()
+
+    #requests are also metered by the usage plan of the tier
+    usage_plan_key = USAGE_PLAN_KEYS.get(tenant_tier) or USAGE_PLAN_KEYS.get('default')
+    if usage_plan_key:
+        authResponse['usageIdentifierKey'] = usage_plan_key
  
     #pass context to lambda
     context = {
@@ -94,49 +304,98 @@ def lambda_handler(event, context):
         'tenant_name': tenant_name,
         'tenant_tier': tenant_tier
     }
+    if throttled:
+        context['throttled'] = 'true'
     
     authResponse['context'] = context
     
     return authResponse
 
-def validateJWT(token, app_client_id, keys):
-    # get the kid from the headers prior to verification
-    headers = jwt.get_unverified_headers(token)
-    kid = headers['kid']
-    # search for the kid in the downloaded public keys
-    key_index = -1
-    for i in range(len(keys)):
-        if kid == keys[i]['kid']:
-            key_index = i
-            break
-    if key_index == -1:
+def _allow_request(tenant_id, tenant_tier, timer):
+    # tiers without limits, and every tier while the limits cannot be read, are not throttled
+    with timer.phase('RateLimit'):
+        limits = tenant_limits(rate_limits_config.get(), tenant_tier)
+        return limits is None or rate_limiter.allow(tenant_id, *limits)
+
+def _has_tenant_claims(claims):
+    # tokens issued before the pre token generation trigger was deployed have none
+    return all(isinstance(claims.get(claim), str) for claim in TENANT_CLAIMS)
+
+def _lookup_tenant(tenant_id, timer):
+    # get tenant details, read through the tenant metadata cache
+    with timer.phase('TenantLookup'):
+        try:
+            tenant, hit = tenant_cache.lookup(tenant_id)
+        except ClientError as e:
+            timer.dimension('TenantCache', 'miss')
+            return None, e
+    timer.dimension('TenantCache', 'hit' if hit else 'miss')
+    return tenant, None
+
+def precheckJWT(token, app_client_id):
+    # structural checks on the unverified token, none of them needs I/O.
+    # the checks on the claims are repeated by validateJWT once the signature
+    # is verified
+    headers = token.header
+    claims = token.claims
+    if headers.get('alg') != 'RS256' or 'kid' not in headers:
+        logger.info('Token is not signed with a user pool key')
+        return False
+    if not isinstance(claims.get('exp'), (int, float)) or time.time() > claims['exp']:
+        logger.info('Token is expired')
+        return False
+    if claims.get('aud') != app_client_id:
+        logger.info('Token was not issued for this audience')
+        return False
+    if 'custom:tenant_id' not in claims:
+        logger.info('Token has no tenant id')
+        return False
+    return True
+
+def validateJWT(token, app_client_id, jwks, timer):
+    # repeat tokens are answered from the cache without verifying the signature again
+    digest = token_cache.digest(token.token)
+    cached_claims = token_cache.get(digest)
+    if cached_claims is not None:
+        logger.info('Token found in verified token cache')
+        timer.dimension('TokenCache', 'hit')
+        return cached_claims
+    if token_cache.is_rejected(digest):
+        logger.info('Token was recently rejected')
+        timer.dimension('TokenCache', 'rejected')
+        return False
+    timer.dimension('TokenCache', 'miss')
+    # look up the prepared public key for the kid of the parsed header,
+    # the key set is refreshed if the kid is unknown
+    with timer.phase('KeyLookup'):
+        public_key = jwks.get_public_key(token.header['kid'])
+    if public_key is None:
+        # not cached as rejected, the kid may appear after a key rotation
         logger.info('Public key not found in jwks.json')
         return False
-    # construct the public key
-    public_key = jwk.construct(keys[key_index])
-    # get the last two sections of the token,
-    # message and signature (encoded in base64)
-    message, encoded_signature = str(token).rsplit('.', 1)
-    # decode the signature
-    decoded_signature = base64url_decode(encoded_signature.encode('utf-8'))
-    # verify the signature
-    if not public_key.verify(message.encode("utf8"), decoded_signature):
+    # verify the signature over the header and payload sections
+    with timer.phase('SignatureVerify'):
+        verified = verifier.verify(token, public_key)
+    if not verified:
         logger.info('Signature verification failed')
+        token_cache.reject(digest)
         return False
     logger.info('Signature successfully verified')
     # since we passed the verification, we can now safely
-    # use the unverified claims
-    claims = jwt.get_unverified_claims(token)
+    # use the claims decoded when the token was parsed
+    claims = token.claims
     # additionally we can verify the token expiration
     if time.time() > claims['exp']:
         logger.info('Token is expired')
+        token_cache.reject(digest)
         return False
     # and the Audience  (use claims['client_id'] if verifying an access token)
     if claims['aud'] != app_client_id:
         logger.info('Token was not issued for this audience')
+        token_cache.reject(digest)
         return False
-    # now we can use the claims
-    logger.info(claims)
+    # now we can use the claims, until the token expires
+    token_cache.put(digest, claims)
     return claims
 
 
@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from aws_lambda_powertools import Logger
+
+import http_client
+
+logger = Logger(child=True)
+
+
+def _construct_jose_key(key: Dict[str, Any]):
+    from jose import jwk
+    return jwk.construct(key)
+
+
+class JwksCache:
+    """Process-wide cache of the user pool JSON Web Key Set (JWKS).
+
+    The key set is kept in memory across warm invocations and refreshed once it
+    is older than `ttl` seconds. A token signed with a `kid` that is not in the
+    cached set triggers an on-demand refresh so key rotation keeps working, but
+    those refreshes are limited to one every `min_refresh_interval` seconds so
+    tokens with made-up `kid` values cannot flood the JWKS endpoint.
+
+    Keys are indexed by `kid`, and the public key objects built from them by
+    `key_factory` (python-jose `jwk.construct` by default) are cached as well so
+    that they are only built once per key. Fetches go through a pooled keep-alive
+    HTTP client."""
+
+    def __init__(self, url: str, ttl: float = 3600, min_refresh_interval: float = 30, http: Optional[http_client.PooledHttpClient] = None,
+                 key_factory: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._http = http
+        self.key_factory = key_factory or _construct_jose_key
+
+        self._keys: List[Dict[str, Any]] = []
+        self._keys_by_kid: Dict[str, Dict[str, Any]] = {}
+        self._public_keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    @property
+    def http(self) -> http_client.PooledHttpClient:
+        if self._http is None:
+            self._http = http_client.get_client('cognito')
+        return self._http
+
+    def get_keys(self, kid: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns the cached keys, fetching them first when the cache is empty or
+        expired, or when `kid` is given and missing from the cached set."""
+        if self._needs_refresh(kid):
+            with self._lock:
+                # another thread may have refreshed while we were waiting
+                if self._needs_refresh(kid):
+                    self._refresh()
+        return self._keys
+
+    def get_key(self, kid: str) -> Optional[Dict[str, Any]]:
+        """Returns the JWK for `kid`, or None if the key set does not contain it."""
+        self.get_keys(kid)
+        return self._keys_by_kid.get(kid)
+
+    def get_public_key(self, kid: str):
+        """Returns the constructed public key for `kid`, or None if the key set does not
+        contain it."""
+        key = self.get_key(kid)
+        if key is None:
+            return None
+        public_keys = self._public_keys
+        public_key = public_keys.get(kid)
+        if public_key is None:
+            public_key = self.key_factory(key)
+            public_keys[kid] = public_key
+        return public_key
+
+    def needs_refresh(self, kid: Optional[str] = None) -> bool:
+        """Returns True if looking up `kid` would fetch the key set."""
+        return self._needs_refresh(kid)
+
+    def clear(self):
+        """Drops the cached keys so that the next lookup fetches them again."""
+        with self._lock:
+            self._keys = []
+            self._keys_by_kid = {}
+            self._public_keys = {}
+            self._expires_at = 0.0
+            self._last_refresh = None
+
+    def _needs_refresh(self, kid: Optional[str]) -> bool:
+        now = time.monotonic()
+        if not self._keys or now >= self._expires_at:
+            return self._refresh_allowed(now) or not self._keys
+        if kid is not None and kid not in self._keys_by_kid:
+            return self._refresh_allowed(now)
+        return False
+
+    def _refresh_allowed(self, now: float) -> bool:
+        return self._last_refresh is None or now - self._last_refresh >= self.min_refresh_interval
+
+    def _refresh(self):
+        import requests
+        self._last_refresh = time.monotonic()
+        try:
+            response = self.http.get(self.url)
+            response.raise_for_status()
+            keys = json.loads(response.text)['keys']
+        except (requests.RequestException, ValueError, KeyError) as e:
+            if not self._keys:
+                raise
+            # keep serving the keys we have, the next refresh is rate limited
+            logger.warning(f"Unable to refresh JWKS, serving cached keys: {e}")
+            return
+
+        keys_by_kid = {key['kid']: key for key in keys}
+        # constructed keys survive a refresh as long as their JWK did not change
+        self._public_keys = {
+            kid: public_key for kid, public_key in self._public_keys.items()
+            if self._keys_by_kid.get(kid) == keys_by_kid.get(kid)
+        }
+        self._keys = keys
+        self._keys_by_kid = keys_by_kid
+        self._expires_at = self._last_refresh + self.ttl
+        logger.info(f"Refreshed JWKS with {len(keys)} keys")
@@ -0,0 +1,202 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(child=True)
+
+
+def tenant_limits(config: Optional[Dict[str, Any]], tier: str) -> Optional[Tuple[float, float]]:
+    """Returns the (rate, burst) of the tenants of `tier` in the rate limits configuration,
+    falling back to the limits of `default_tier`, or None when the tier is not limited."""
+    if not config:
+        return None
+    limits = config.get('tenant_limits', {})
+    entry = limits.get(tier) or limits.get(config.get('default_tier'))
+    if not entry:
+        return None
+    return float(entry['rate']), float(entry['burst'])
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TenantRateLimiter:
+    """Token bucket per tenant, in the memory of the execution environment.
+
+    A bucket holds up to `burst` tokens and refills at `rate` tokens per second, and
+    each request takes one token. With `shared`, a request allowed by the local
+    bucket must also be allowed by the approximate count shared by all execution
+    environments. Beyond `maxsize` tenants, the buckets of the least recently seen
+    ones are dropped."""
+
+    def __init__(self, maxsize: int = 4096, shared: Optional['SharedWindowCounter'] = None):
+        self.maxsize = maxsize
+        self.shared = shared
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, tenant_id: str, rate: float, burst: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(tenant_id)
+            if bucket is None:
+                bucket = self._buckets[tenant_id] = TokenBucket(burst, now)
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(tenant_id)
+                bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+                bucket.updated = now
+            if bucket.tokens < 1:
+                return False
+            bucket.tokens -= 1
+        if self.shared is not None:
+            return self.shared.allow(tenant_id, rate, burst)
+        return True
+
+
+class _Window:
+    __slots__ = ('start', 'shared', 'pending', 'synced_at', 'syncing')
+
+    def __init__(self, start: int):
+        self.start = start
+        # last total read from the table, and the requests not added to it yet
+        self.shared = 0
+        self.pending = 0
+        self.synced_at = 0.0
+        self.syncing = False
+
+
+class SharedWindowCounter:
+    """Approximate number of requests of each tenant across all execution environments,
+    counted in fixed windows of `window` seconds.
+
+    Allowed requests are counted locally and added to the shared counter by
+    `increment(counter_id, count, expires_at)`, which returns the new total, at most
+    once every `sync_interval` seconds per tenant and on `executor`, so requests do
+    not wait for the shared store. A tenant gets `rate * window + burst` requests per
+    window; the limit can be exceeded by what other environments allowed since their
+    last sync. When the shared store fails, the local buckets still apply."""
+
+    def __init__(self, increment: Callable[[str, int, int], int], executor, window: int = 60,
+                 sync_interval: float = 2, maxsize: int = 4096):
+        self.increment = increment
+        self.executor = executor
+        self.window = window
+        self.sync_interval = sync_interval
+        self.maxsize = maxsize
+        self._windows: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, tenant_id: str, rate: float, burst: float) -> bool:
+        now = time.time()
+        start = int(now // self.window) * self.window
+        with self._lock:
+            window = self._windows.get(tenant_id)
+            if window is None or window.start != start:
+                window = self._windows[tenant_id] = _Window(start)
+                if len(self._windows) > self.maxsize:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(tenant_id)
+            if window.shared + window.pending >= rate * self.window + burst:
+                return False
+            window.pending += 1
+            sync = not window.syncing and now - window.synced_at >= self.sync_interval
+            if sync:
+                window.syncing = True
+                count = window.pending
+        if sync:
+            self.executor.submit(self._sync, tenant_id, window, count)
+        return True
+
+    def _sync(self, tenant_id: str, window: _Window, count: int):
+        try:
+            # counters outlive their window a little, the table expires them
+            total = self.increment(f'{tenant_id}#{window.start}', count, window.start + 2 * self.window)
+            with self._lock:
+                window.shared = total
+                window.pending -= count
+        except Exception as e:
+            logger.warning("Unable to update the shared request count: %s", e)
+        finally:
+            with self._lock:
+                window.syncing = False
+                window.synced_at = time.time()
+
+
+class AppConfigPoller:
+    """Latest content of a JSON AppConfig configuration profile, read through the
+    AppConfig data API by the functions that do not run the AppConfig extension.
+
+    The first call waits for the configuration, later calls return the configuration
+    held and poll for a new version on `executor` once `poll_interval` seconds have
+    passed. None is returned while no configuration could be read."""
+
+    def __init__(self, client_factory: Callable[[], Any], application: str, environment: str, profile: str,
+                 executor, poll_interval: int = 30):
+        self.client_factory = client_factory
+        self.application = application
+        self.environment = environment
+        self.profile = profile
+        self.executor = executor
+        self.poll_interval = poll_interval
+
+        self._client = None
+        self._token = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._next_poll = 0.0
+        self._polling = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            due = not self._polling and time.monotonic() >= self._next_poll
+            if due:
+                self._polling = True
+            first = self._config is None
+        if due:
+            if first:
+                self._poll()
+            else:
+                self.executor.submit(self._poll)
+        return self._config
+
+    def _poll(self):
+        try:
+            if self._client is None:
+                self._client = self.client_factory()
+            if self._token is None:
+                self._token = self._client.start_configuration_session(
+                    ApplicationIdentifier=self.application,
+                    EnvironmentIdentifier=self.environment,
+                    ConfigurationProfileIdentifier=self.profile,
+                    RequiredMinimumPollIntervalInSeconds=self.poll_interval
+                )['InitialConfigurationToken']
+            response = self._client.get_latest_configuration(ConfigurationToken=self._token)
+            self._token = response['NextPollConfigurationToken']
+            content = response['Configuration'].read()
+            # an empty content means the configuration did not change
+            if content:
+                self._config = json.loads(content)
+                logger.info("Loaded configuration %s", self.profile)
+            interval = response.get('NextPollIntervalInSeconds', self.poll_interval)
+        except Exception as e:
+            # the session may have expired, start a new one on the next poll
+            logger.warning("Unable to read configuration %s: %s", self.profile, e)
+            self._token = None
+            interval = self.poll_interval
+        with self._lock:
+            self._next_poll = time.monotonic() + interval
+            self._polling = False
@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class TenantRecord:
+    """Tenant metadata as stored in the tenant metadata table."""
+    __slots__ = ('tenant_id', 'tenant_name', 'tenant_tier', 'fullname', 'expires_at')
+
+    def __init__(self, tenant_id: str, tenant_name: str, tenant_tier: str, fullname: str, expires_at: float):
+        self.tenant_id = tenant_id
+        self.tenant_name = tenant_name
+        self.tenant_tier = tenant_tier
+        self.fullname = fullname
+        self.expires_at = expires_at
+
+
+class TenantMetadataCache:
+    """Bounded read-through cache in front of the tenant metadata lookup.
+
+    `loader` is called with a tenant ID on a miss and returns the tenant item, or
+    None if the tenant does not exist. Records are kept for `ttl` seconds and
+    unknown tenant IDs for `negative_ttl` seconds. Errors raised by the loader are
+    not cached. Once `maxsize` tenants are cached, the least recently used one is
+    evicted."""
+
+    def __init__(self, loader: Callable[[str], Optional[Dict[str, Any]]], maxsize: int = 1024, ttl: float = 300, negative_ttl: float = 30):
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        # tenant_id -> TenantRecord, or the expiry time of a negative entry
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str) -> Optional[TenantRecord]:
+        """Returns the tenant record, or None if the tenant does not exist."""
+        return self.lookup(tenant_id)[0]
+
+    def lookup(self, tenant_id: str) -> Tuple[Optional[TenantRecord], bool]:
+        """Same as `get`, also returning whether the answer came from the cache."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None:
+                if isinstance(entry, TenantRecord):
+                    if now < entry.expires_at:
+                        self._entries.move_to_end(tenant_id)
+                        return entry, True
+                elif now < entry:
+                    self._entries.move_to_end(tenant_id)
+                    return None, True
+                del self._entries[tenant_id]
+
+        item = self.loader(tenant_id)
+        if item is None:
+            entry = time.monotonic() + self.negative_ttl
+        else:
+            entry = TenantRecord(
+                tenant_id=tenant_id,
+                tenant_name=item['tenant_name'],
+                tenant_tier=item['tenant_tier'],
+                fullname=item['fullname'],
+                expires_at=time.monotonic() + self.ttl
+            )
+        self._store(tenant_id, entry)
+        return (entry if item is not None else None), False
+
+    def invalidate(self, tenant_id: str):
+        """Drops the cached entry of a tenant, e.g. after its tier has changed."""
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, tenant_id: str, entry):
+        with self._lock:
+            self._entries[tenant_id] = entry
+            self._entries.move_to_end(tenant_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TokenCache:
+    """Bounded LRU cache of JWT verification decisions.
+
+    Tokens are stored by their SHA-256 digest, never in clear. Verified tokens map
+    to their claims and expire at the token's own `exp`, so a cached decision is
+    never valid for longer than the token itself. Tokens that failed verification
+    are kept in a smaller negative cache for `negative_ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, negative_maxsize: int = 128, negative_ttl: float = 60):
+        self.maxsize = maxsize
+        self.negative_maxsize = negative_maxsize
+        self.negative_ttl = negative_ttl
+
+        self._verified: OrderedDict = OrderedDict()
+        self._rejected: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        """Returns the claims of a previously verified token that has not expired yet."""
+        with self._lock:
+            entry = self._verified.get(digest)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if time.time() > expires_at:
+                del self._verified[digest]
+                return None
+            self._verified.move_to_end(digest)
+            return claims
+
+    def put(self, digest: bytes, claims: Dict[str, Any]):
+        with self._lock:
+            self._verified[digest] = (claims, claims['exp'])
+            self._verified.move_to_end(digest)
+            while len(self._verified) > self.maxsize:
+                self._verified.popitem(last=False)
+
+    def is_rejected(self, digest: bytes) -> bool:
+        """Returns True if the token failed verification within the last `negative_ttl` seconds."""
+        with self._lock:
+            expires_at = self._rejected.get(digest)
+            if expires_at is None:
+                return False
+            if time.monotonic() > expires_at:
+                del self._rejected[digest]
+                return False
+            return True
+
+    def reject(self, digest: bytes):
+        with self._lock:
+            self._rejected[digest] = time.monotonic() + self.negative_ttl
+            self._rejected.move_to_end(digest)
+            while len(self._rejected) > self.negative_maxsize:
+                self._rejected.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+            self._rejected.clear()
@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import base64
+import binascii
+import json
+from typing import Any, Dict
+
+
+class InvalidToken(ValueError):
+    """Raised when a token is not a well-formed JWS compact serialization."""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class ParsedToken:
+    """A JWT split and decoded once: the header and claims as dicts, plus the signing
+    input and signature bytes the verifiers check."""
+
+    __slots__ = ('token', 'header', 'claims', 'signing_input', 'signature')
+
+    def __init__(self, token: str):
+        parts = token.split('.')
+        if len(parts) != 3:
+            raise InvalidToken('Token is not a JWS compact serialization')
+        try:
+            header = json.loads(_b64decode(parts[0]))
+            claims = json.loads(_b64decode(parts[1]))
+            signature = _b64decode(parts[2])
+        except (binascii.Error, ValueError) as e:
+            raise InvalidToken(f'Token could not be decoded: {e}') from e
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise InvalidToken('Token header and claims must be JSON objects')
+
+        self.token = token
+        self.header: Dict[str, Any] = header
+        self.claims: Dict[str, Any] = claims
+        self.signing_input = token[:len(parts[0]) + len(parts[1]) + 1].encode('ascii')
+        self.signature = signature
+
+
+class JoseVerifier:
+    """Verifies RS256 signatures with python-jose key objects."""
+
+    name = 'jose'
+
+    def prepare_key(self, key: Dict[str, Any]):
+        from jose import jwk
+        return jwk.construct(key, 'RS256')
+
+    def verify(self, token: ParsedToken, public_key) -> bool:
+        return public_key.verify(token.signing_input, token.signature)
+
+
+class RsaVerifier:
+    """Verifies RS256 signatures directly with the cryptography package, which
+    python-jose already depends on. The public key object is built once per JWK and
+    reused. Both backends spend most of the time in the same RSA verification, so
+    their throughput is about the same."""
+
+    name = 'rsa'
+
+    def __init__(self):
+        # cryptography is imported with the first key, not at INIT
+        self._invalid_signature = None
+        self._padding = None
+        self._hash = None
+
+    def prepare_key(self, key: Dict[str, Any]):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+        if key.get('kty') != 'RSA':
+            raise ValueError(f"Unsupported key type {key.get('kty')}")
+        if self._padding is None:
+            self._invalid_signature = InvalidSignature
+            self._padding = padding.PKCS1v15()
+            self._hash = hashes.SHA256()
+        numbers = rsa.RSAPublicNumbers(
+            e=int.from_bytes(_b64decode(key['e']), 'big'),
+            n=int.from_bytes(_b64decode(key['n']), 'big')
+        )
+        return numbers.public_key()
+
+    def verify(self, token: ParsedToken, public_key) -> bool:
+        try:
+            public_key.verify(token.signature, token.signing_input, self._padding, self._hash)
+            return True
+        except self._invalid_signature:
+            return False
+
+
+VERIFIERS = {
+    JoseVerifier.name: JoseVerifier,
+    RsaVerifier.name: RsaVerifier,
+}
+
+
+def get_verifier(name: str):
+    try:
+        return VERIFIERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown JWT verifier {name}, expected one of {sorted(VERIFIERS)}") from None
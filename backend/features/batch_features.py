@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Evaluates the enabled features of many tenants against one configuration snapshot.
+
+Contexts are read as newline-delimited JSON, one object per tenant such as
+{"tenant_id": "...", "tier": "premium"}, and results are written back as
+newline-delimited JSON in the same order. Identical contexts are only evaluated
+once, and input is processed one line at a time so memory use does not depend
+on the size of the batch. When the configuration only has conditions on the tier
+and no feature targets tenants, the tenant ID does not change the result and is
+left out of the comparison, so the tenants of a tier are evaluated once.
+
+    PYTHONPATH=backend/shared python backend/features/batch_features.py \\
+        --config features.json tenants.ndjson > entitlements.ndjson
+
+Without --config the configuration is fetched from the AppConfig Lambda extension,
+using the same CONFIG_APP_NAME, CONFIG_ENV_NAME and CONFIG_PROFILE_NAME environment
+variables as the features service.
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from aws_lambda_powertools.utilities.feature_flags.base import StoreProvider
+from aws_lambda_powertools.utilities.feature_flags.feature_flags import FeatureFlags
+
+from compiled_flags import CompiledFeatureFlags
+
+# keys identifying the tenant, ignored when the result only depends on the tier
+IDENTITY_KEYS = ("tenant_id",)
+
+
+class StaticStoreProvider(StoreProvider):
+    """Store provider serving a fixed configuration snapshot."""
+
+    def __init__(self, config: Dict[str, Any], config_version: Optional[str] = None):
+        super().__init__()
+        self.config = config
+        self.config_version = config_version
+
+    def get_configuration(self) -> Dict[str, Any]:
+        return self.config
+
+    @property
+    def get_raw_configuration(self) -> Dict[str, Any]:
+        return self.config
+
+
+class BatchEvaluator:
+    """Evaluates contexts against one configuration snapshot, remembering the result
+    of up to `max_contexts` distinct evaluation contexts."""
+
+    def __init__(self, config: Dict[str, Any], config_version: Optional[str] = None, max_contexts: int = 4096):
+        store = StaticStoreProvider(config, config_version)
+        self.compiled_flags = CompiledFeatureFlags(feature_flags=FeatureFlags(store=store), store=store)
+        self.compiled_flags.prepare()
+        self.max_contexts = max_contexts
+        self.evaluations = 0
+        self._results: OrderedDict = OrderedDict()
+
+    def evaluate(self, context: Dict[str, Any]) -> List[str]:
+        if self.compiled_flags.tier_only:
+            key_context = {key: value for key, value in context.items() if key not in IDENTITY_KEYS}
+        else:
+            key_context = context
+        key = json.dumps(key_context, sort_keys=True)
+        features = self._results.get(key)
+        if features is None:
+            features = self.compiled_flags.get_enabled_features(context=context)
+            self.evaluations += 1
+            self._results[key] = features
+            if len(self._results) > self.max_contexts:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(key)
+        return features
+
+    def iter_results(self, lines: Iterable[str]) -> Iterator[str]:
+        """Yields one result line per non-empty input line."""
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                context = json.loads(line)
+                if not isinstance(context, dict):
+                    raise ValueError("context must be a JSON object")
+                result = dict(context, features=self.evaluate(context))
+            except (ValueError, TypeError) as e:
+                # TypeError for values the evaluation cannot use, such as a list as tier
+                result = {"line": line_number, "error": str(e)}
+            yield json.dumps(result) + "\n"
+
+
+def evaluate_batch(lines: Iterable[str], config: Dict[str, Any], out: TextIO, config_version: Optional[str] = None) -> BatchEvaluator:
+    evaluator = BatchEvaluator(config, config_version)
+    for result in evaluator.iter_results(lines):
+        out.write(result)
+    return evaluator
+
+
+def _load_config(path: str):
+    if path:
+        with open(path) as config_file:
+            return json.load(config_file), None
+
+    from store_provider import AppConfigStoreProvider
+    store = AppConfigStoreProvider(
+        config_app=os.environ['CONFIG_APP_NAME'],
+        config_env=os.environ['CONFIG_ENV_NAME'],
+        config_profile=os.environ['CONFIG_PROFILE_NAME']
+    )
+    return store.get_configuration(), store.config_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate enabled features for a batch of tenant contexts")
+    parser.add_argument("input", nargs="?", help="newline-delimited JSON contexts, defaults to stdin")
+    parser.add_argument("--config", help="feature flags configuration file, defaults to the AppConfig extension")
+    args = parser.parse_args()
+
+    config, config_version = _load_config(args.config)
+    lines = open(args.input) if args.input else sys.stdin
+    try:
+        evaluator = evaluate_batch(lines, config, sys.stdout, config_version)
+    finally:
+        if args.input:
+            lines.close()
+    print(f"Evaluated {evaluator.evaluations} distinct contexts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
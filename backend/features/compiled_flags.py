@@ -0,0 +1,440 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.feature_flags.base import StoreProvider
+from aws_lambda_powertools.utilities.feature_flags.exceptions import ConfigurationStoreError, SchemaValidationError
+from aws_lambda_powertools.utilities.feature_flags.feature_flags import FeatureFlags
+from aws_lambda_powertools.utilities.feature_flags.schema import SchemaValidator
+
+from phase_timer import MetricCounters
+
+logger = Logger(child=True)
+
+TIER_KEY = "tier"
+TENANT_KEY = "tenant_id"
+
+# Targeting keys, not known to the Powertools rule engine. A rule with a rollout
+# percentage only matches that share of the tenants, and the tenants listed in a
+# feature's deny or allow list always get it disabled or enabled.
+ROLLOUT_KEY = "rollout_percentage"
+ALLOW_TENANTS_KEY = "allow_tenants"
+DENY_TENANTS_KEY = "deny_tenants"
+# rollout buckets of 0.01 percent
+ROLLOUT_BUCKETS = 10000
+
+# Rule actions whose outcome only depends on the context value, mirroring the
+# Powertools rule engine. Time based actions are not listed, configurations
+# using them are always evaluated by the rule engine.
+CONDITION_MATCHERS: Dict[str, Callable[[Any, Any], bool]] = {
+    "EQUALS": lambda a, b: a == b,
+    "NOT_EQUALS": lambda a, b: a != b,
+    "KEY_GREATER_THAN_VALUE": lambda a, b: a > b,
+    "KEY_GREATER_THAN_OR_EQUAL_VALUE": lambda a, b: a >= b,
+    "KEY_LESS_THAN_VALUE": lambda a, b: a < b,
+    "KEY_LESS_THAN_OR_EQUAL_VALUE": lambda a, b: a <= b,
+    "STARTSWITH": lambda a, b: a.startswith(b),
+    "ENDSWITH": lambda a, b: a.endswith(b),
+    "IN": lambda a, b: a in b,
+    "NOT_IN": lambda a, b: a not in b,
+    "KEY_IN_VALUE": lambda a, b: a in b,
+    "KEY_NOT_IN_VALUE": lambda a, b: a not in b,
+    "VALUE_IN_KEY": lambda a, b: b in a,
+    "VALUE_NOT_IN_KEY": lambda a, b: b not in a,
+}
+
+
+def _match_condition(condition: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    context_value = context.get(condition["key"])
+    if not context_value:
+        return False
+    try:
+        return CONDITION_MATCHERS[condition["action"]](context_value, condition["value"])
+    except Exception:
+        return False
+
+
+def _feature_enabled(feature: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    # same semantics as FeatureFlags.get_enabled_features, the first matching
+    # rule decides and the feature default applies when none matches
+    rules = feature.get("rules", {})
+    default = feature.get("default")
+    if not rules:
+        return bool(default)
+    for rule in rules.values():
+        conditions = rule.get("conditions")
+        if conditions and all(_match_condition(condition, context) for condition in conditions):
+            # non boolean features are enabled when their value is truthy
+            return bool(rule.get("when_match"))
+    return bool(default)
+
+
+def rollout_bucket(feature_name: str, tenant_id: str) -> int:
+    """Stable bucket of a tenant for a feature, between 0 and ROLLOUT_BUCKETS - 1. Hashing
+    the feature name as well gives each rollout a different first share of tenants."""
+    digest = hashlib.blake2b(f"{feature_name}\0{tenant_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % ROLLOUT_BUCKETS
+
+
+def _has_targeting(feature: Dict[str, Any]) -> bool:
+    return (ALLOW_TENANTS_KEY in feature or DENY_TENANTS_KEY in feature
+            or any(ROLLOUT_KEY in rule for rule in feature.get("rules", {}).values()))
+
+
+def _validate_targeting(config: Dict[str, Any]):
+    for name, feature in config.items():
+        for key in (ALLOW_TENANTS_KEY, DENY_TENANTS_KEY):
+            tenants = feature.get(key, [])
+            if not isinstance(tenants, list) or not all(isinstance(tenant, str) for tenant in tenants):
+                raise SchemaValidationError(f"'{key}' of feature '{name}' must be a list of tenant IDs")
+        for rule_name, rule in feature.get("rules", {}).items():
+            percentage = rule.get(ROLLOUT_KEY, 0)
+            if isinstance(percentage, bool) or not isinstance(percentage, (int, float)) or not 0 <= percentage <= 100:
+                raise SchemaValidationError(f"'{ROLLOUT_KEY}' of rule '{rule_name}' must be a number between 0 and 100")
+
+
+class _TenantTargeting:
+    """Outcome of a targeted feature for the tenants of one tier. The tenant lists are
+    sets shared by all tiers and only the rules matching the tier are kept, so a
+    tenant is evaluated with two set lookups and at most one hash per rule."""
+    __slots__ = ("name", "allow", "deny", "outcomes", "default")
+
+    def __init__(self, name: str, feature: Dict[str, Any], tenant_lists: tuple, context: Dict[str, Any]):
+        self.name = name
+        self.allow, self.deny = tenant_lists
+        # (rollout threshold or None, outcome) of the rules whose conditions match
+        self.outcomes = []
+        for rule in feature.get("rules", {}).values():
+            conditions = rule.get("conditions")
+            if conditions and all(_match_condition(condition, context) for condition in conditions):
+                percentage = rule.get(ROLLOUT_KEY)
+                threshold = None if percentage is None else percentage * ROLLOUT_BUCKETS / 100
+                self.outcomes.append((threshold, bool(rule.get("when_match"))))
+                if threshold is None:
+                    # the rules after it are never reached
+                    break
+        self.default = bool(feature.get("default"))
+
+    def enabled(self, tenant_id: Optional[str]) -> bool:
+        if tenant_id is not None:
+            if tenant_id in self.deny:
+                return False
+            if tenant_id in self.allow:
+                return True
+        for threshold, outcome in self.outcomes:
+            if threshold is None or (tenant_id is not None and rollout_bucket(self.name, tenant_id) < threshold):
+                return outcome
+        return self.default
+
+
+def _is_tier_only(feature: Dict[str, Any]) -> bool:
+    for rule in feature.get("rules", {}).values():
+        for condition in rule.get("conditions", []):
+            if condition.get("key") != TIER_KEY or condition.get("action") not in CONDITION_MATCHERS:
+                return False
+    return True
+
+
+def _feature_tiers(feature: Dict[str, Any]) -> List[Any]:
+    tiers = []
+    for rule in feature.get("rules", {}).values():
+        for condition in rule.get("conditions", []):
+            value = condition.get("value")
+            for tier in value if isinstance(value, list) else [value]:
+                if isinstance(tier, str) and tier not in tiers:
+                    tiers.append(tier)
+    return tiers
+
+
+class _TierEntry:
+    """Enabled features of a tier, and their JSON serialization once requested.
+
+    `plan` lists the enabled and the targeted features in configuration order, each
+    targeted feature with its `_TenantTargeting`. Without targeted features the
+    result is the same for every tenant of the tier."""
+    __slots__ = ("plan", "features", "enabled", "targeted", "fragment")
+
+    def __init__(self, plan: List[tuple]):
+        self.plan = plan
+        self.features = [name for name, targeting in plan if targeting is None]
+        self.enabled = frozenset(self.features)
+        self.targeted = len(self.features) != len(plan)
+        self.fragment: Optional[str] = None
+
+    def evaluate(self, tenant_id: Optional[str]) -> List[str]:
+        if not self.targeted:
+            return self.features
+        return [name for name, targeting in self.plan if targeting is None or targeting.enabled(tenant_id)]
+
+
+def _tenant_lists(feature: Dict[str, Any]) -> tuple:
+    return frozenset(feature.get(ALLOW_TENANTS_KEY, ())), frozenset(feature.get(DENY_TENANTS_KEY, ()))
+
+
+def _is_table_context(context: Optional[Dict[str, Any]]) -> bool:
+    # contexts the table answers, the tier and optionally the tenant
+    return bool(context) and TIER_KEY in context and all(key in (TIER_KEY, TENANT_KEY) for key in context)
+
+
+def _fingerprint(config: Dict[str, Any]) -> str:
+    # keys are not sorted, the order of the features and rules changes the result
+    return hashlib.sha256(json.dumps(config, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+
+
+def _same(a: Any, b: Any) -> bool:
+    # dictionary equality ignores the order of the keys, which decides the first
+    # matching rule and the order of the enabled features
+    return a is b or json.dumps(a) == json.dumps(b)
+
+
+class CompiledFeatureFlags:
+    """Evaluates the enabled features of a tier with a precomputed lookup table.
+
+    When every rule condition of the configuration is on the `tier` key, the
+    enabled features are a pure function of the configuration version and the
+    tier. The table is built once per configuration version for every tier named
+    in the rules, and filled on first use for any other tier (up to `max_tiers`
+    entries), so evaluating a request is a dictionary lookup. Features with a
+    rollout percentage or tenant lists are kept in the table per tier as well and
+    evaluated for the `tenant_id` of the context in constant time. Contexts with
+    other keys than `tier` and `tenant_id`, and configurations the table cannot
+    represent, are evaluated by the Powertools rule engine, which does not know
+    the targeting keys: targeted features are then left disabled.
+
+    The time spent getting the configuration from the store, compiling it and
+    evaluating a context are recorded separately in `metrics`, along with how
+    often the table answered.
+
+    The returned lists are shared between calls and must not be modified."""
+
+    def __init__(self, feature_flags: FeatureFlags, store: StoreProvider, max_tiers: int = 64):
+        self.feature_flags = feature_flags
+        self.store = store
+        self.max_tiers = max_tiers
+
+        self.config_version: Optional[str] = None
+        # identifies the compiled configuration, its version or a hash of its content
+        self.config_fingerprint: Optional[str] = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._table: Optional[OrderedDict] = None
+        # per feature facts of the compiled configuration, kept for unchanged features
+        self._non_tier_features = set()
+        self._tiers_by_feature: Dict[str, List[Any]] = {}
+        # targeted feature -> (allow, deny) tenant sets
+        self._tenant_lists: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.metrics = MetricCounters()
+
+    def get_enabled_features(self, *, context: Optional[Dict[str, Any]] = None, refresh: bool = True) -> List[str]:
+        """Returns the enabled features for `context`. With `refresh=False` the
+        configuration loaded by the last call, e.g. to `current_fingerprint`, is used
+        without asking the store again."""
+        if not _is_table_context(context):
+            return self._evaluate_with_rule_engine(context)
+        entry = self._get_entry(context, refresh)
+        return entry.evaluate(context.get(TENANT_KEY)) if isinstance(entry, _TierEntry) else entry
+
+    def get_enabled_features_json(self, *, context: Optional[Dict[str, Any]] = None, refresh: bool = True) -> str:
+        """Same as `get_enabled_features`, serialized as a JSON array. The serialization
+        of a tier without targeted features is kept as long as its enabled features do
+        not change."""
+        if not _is_table_context(context):
+            return json.dumps(self._evaluate_with_rule_engine(context))
+        entry = self._get_entry(context, refresh)
+        if not isinstance(entry, _TierEntry):
+            return json.dumps(entry)
+        if entry.targeted:
+            return json.dumps(entry.evaluate(context.get(TENANT_KEY)))
+        if entry.fragment is None:
+            entry.fragment = json.dumps(entry.features)
+        return entry.fragment
+
+    def _get_entry(self, context: Dict[str, Any], refresh: bool):
+        try:
+            if not refresh and self._config is not None:
+                config, table = self._config, self._table
+            else:
+                config, table = self._get_table()
+        except ConfigurationStoreError as err:
+            # same behaviour as the rule engine when the store is unavailable
+            logger.debug(f"Failed to fetch feature flags from store, returning empty list, reason={err}")
+            return []
+        if table is None:
+            return self._evaluate_with_rule_engine(context, loaded=True)
+
+        start = time.perf_counter()
+        tier = context[TIER_KEY]
+        entry = table.get(tier)
+        if entry is None:
+            self.metrics.count('TableMisses')
+            entry = self._build_entry(config, tier)
+            with self._lock:
+                if self._table is table:
+                    table[tier] = entry
+                    while len(table) > self.max_tiers:
+                        table.popitem(last=False)
+        else:
+            self.metrics.count('TableHits')
+        self.metrics.add_duration('Evaluate', (time.perf_counter() - start) * 1000)
+        return entry
+
+    def _evaluate_with_rule_engine(self, context: Optional[Dict[str, Any]], loaded: bool = False) -> List[str]:
+        if not loaded:
+            # the targeted features of the configuration must be known
+            try:
+                self._get_table()
+            except ConfigurationStoreError:
+                pass
+        # includes the time the rule engine spends getting the configuration
+        start = time.perf_counter()
+        features = self.feature_flags.get_enabled_features(context=context)
+        if self._tenant_lists:
+            # the rule engine would enable a rollout for every tenant
+            features = [name for name in features if name not in self._tenant_lists]
+        self.metrics.count('RuleEngineEvaluations')
+        self.metrics.add_duration('Evaluate', (time.perf_counter() - start) * 1000)
+        return features
+
+    @property
+    def has_tenant_targeting(self) -> bool:
+        """Whether the compiled configuration has features whose outcome depends on the tenant."""
+        return bool(self._tenant_lists)
+
+    @property
+    def tier_only(self) -> bool:
+        """Whether the enabled features of the compiled configuration only depend on the
+        tier: the table answers, and no feature targets tenants."""
+        return self._table is not None and not self._tenant_lists
+
+    def _build_entry(self, config: Dict[str, Any], tier: Any) -> _TierEntry:
+        context = {TIER_KEY: tier}
+        plan = []
+        for name, feature in config.items():
+            tenant_lists = self._tenant_lists.get(name)
+            if tenant_lists is not None:
+                plan.append((name, _TenantTargeting(name, feature, tenant_lists, context)))
+            elif _feature_enabled(feature, context):
+                plan.append((name, None))
+        return _TierEntry(plan)
+
+    def prepare(self):
+        """Loads and compiles the current configuration ahead of the first evaluation."""
+        self._get_table()
+
+    def current_fingerprint(self) -> str:
+        """Loads the current configuration and returns its fingerprint, raising
+        ConfigurationStoreError when the store is unavailable."""
+        self._get_table()
+        return self.config_fingerprint
+
+    def _get_table(self):
+        start = time.perf_counter()
+        try:
+            config = self.store.get_configuration()
+        finally:
+            self.metrics.add_duration('ConfigLoad', (time.perf_counter() - start) * 1000)
+        version = getattr(self.store, "config_version", None)
+        if self._config is not None:
+            if version is not None:
+                unchanged = version == self.config_version
+            else:
+                unchanged = _same(config, self._config)
+            if unchanged:
+                return self._config, self._table
+
+        with self._lock:
+            start = time.perf_counter()
+            previous = self._config if isinstance(config, dict) else None
+            if previous is None:
+                changed = None
+                SchemaValidator(schema=config).validate()
+                _validate_targeting(config)
+            else:
+                # only the features that differ from the compiled configuration are
+                # validated and evaluated again
+                changed = [name for name, feature in config.items() if not _same(previous.get(name), feature)]
+                SchemaValidator(schema={name: config[name] for name in changed}).validate()
+                _validate_targeting({name: config[name] for name in changed})
+            self.config_version = version
+            self.config_fingerprint = version if version is not None else _fingerprint(config)
+            self._table = self._compile(config, previous, changed)
+            self._config = config
+            self.metrics.count('Compilations')
+            self.metrics.add_duration('Compile', (time.perf_counter() - start) * 1000)
+            return config, self._table
+
+    def _compile(self, config: Dict[str, Any], previous: Optional[Dict[str, Any]], changed: Optional[List[str]]) -> Optional[OrderedDict]:
+        if changed is None:
+            self._non_tier_features = {name for name, feature in config.items() if not _is_tier_only(feature)}
+            self._tiers_by_feature = {name: _feature_tiers(feature) for name, feature in config.items()}
+            self._tenant_lists = {name: _tenant_lists(feature) for name, feature in config.items() if _has_targeting(feature)}
+        else:
+            for name in previous.keys() - config.keys():
+                self._non_tier_features.discard(name)
+                self._tiers_by_feature.pop(name, None)
+                self._tenant_lists.pop(name, None)
+            for name in changed:
+                if _is_tier_only(config[name]):
+                    self._non_tier_features.discard(name)
+                else:
+                    self._non_tier_features.add(name)
+                self._tiers_by_feature[name] = _feature_tiers(config[name])
+                if _has_targeting(config[name]):
+                    self._tenant_lists[name] = _tenant_lists(config[name])
+                else:
+                    self._tenant_lists.pop(name, None)
+
+        if self._non_tier_features:
+            logger.info(f"Configuration version {self.config_version} has conditions on other keys than tier, using the rule engine")
+            if self._tenant_lists:
+                logger.warning(f"Targeted features {sorted(self._tenant_lists)} are disabled, the rule engine does not support targeting")
+            return None
+
+        tiers = []
+        for name in config:
+            for tier in self._tiers_by_feature[name]:
+                if tier not in tiers:
+                    tiers.append(tier)
+
+        previous_table = self._table
+        if changed is None or previous_table is None:
+            table = OrderedDict()
+            for tier in tiers:
+                table[tier] = self._build_entry(config, tier)
+            logger.info(f"Compiled configuration version {self.config_version} for tiers {list(table.keys())}")
+            return table
+
+        # tiers filled on first use are kept as well, up to max_tiers
+        tiers += [tier for tier in previous_table if tier not in tiers]
+        order_changed = [name for name in previous if name in config] != [name for name in config if name in previous]
+        removed = previous.keys() - config.keys()
+        table = OrderedDict()
+        targeting_changed = any(name in self._tenant_lists for name in changed)
+        for tier in tiers[:self.max_tiers]:
+            context = {TIER_KEY: tier}
+            entry = previous_table.get(tier)
+            if entry is None or entry.targeted or targeting_changed:
+                table[tier] = self._build_entry(config, tier)
+                continue
+            enabled = set(entry.enabled - removed)
+            for name in changed:
+                if _feature_enabled(config[name], context):
+                    enabled.add(name)
+                else:
+                    enabled.discard(name)
+            if enabled == entry.enabled and not order_changed:
+                # unchanged result, the list and its serialization are kept
+                table[tier] = entry
+                continue
+            features = [name for name in config if name in enabled]
+            table[tier] = entry if features == entry.features else _TierEntry([(name, None) for name in features])
+        self.metrics.count('FeaturesRecompiled', len(changed))
+        logger.info(f"Recompiled configuration version {self.config_version}: {len(changed)} of {len(config)} features changed")
+        return table
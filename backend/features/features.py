@@ -3,56 +3,173 @@
 
 import os
 import json
+import hashlib
 
 from aws_lambda_powertools.utilities.feature_flags.feature_flags import FeatureFlags
-from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.utilities.feature_flags.exceptions import ConfigurationStoreError
 
+import http_client
+from compiled_flags import CompiledFeatureFlags
+from phase_timer import PhaseTimer
+from response_cache import ResponseFragmentCache
+from sampled_logging import get_logger
+from snapshot_store import LayeredStoreProvider, SnapshotStoreProvider
 from store_provider import AppConfigStoreProvider
 
-logger = Logger()
+logger = get_logger()
+metrics = Metrics(namespace=os.environ.get('METRICS_NAMESPACE', 'SaaSPricingTiers'), service='features')
 
 # Constants
 REGION = os.environ['AWS_REGION']
 CONFIG_APP_NAME = os.environ['CONFIG_APP_NAME']
 CONFIG_ENV_NAME = os.environ['CONFIG_ENV_NAME']
 CONFIG_PROFILE_NAME = os.environ['CONFIG_PROFILE_NAME']
+# seconds to serve the parsed configuration from memory, unset to call the AppConfig agent on every evaluation
+CONFIG_CACHE_TTL = float(os.environ['CONFIG_CACHE_TTL']) if os.environ.get('CONFIG_CACHE_TTL') else None
+APPCONFIG_AGENT_PORT = int(os.environ.get('AWS_APPCONFIG_EXTENSION_HTTP_PORT', 2772))
+# publish timings at 1 second instead of 1 minute resolution, high resolution metrics cost more
+METRICS_HIGH_RESOLUTION = os.environ.get('METRICS_HIGH_RESOLUTION', 'false').lower() == 'true'
+# load and compile the configuration during the INIT phase instead of the first request
+PREWARM_ON_INIT = os.environ.get('PREWARM_ON_INIT', 'false').lower() == 'true'
+# Cache-Control of the response per tier, as a JSON object such as {"basic": "private, max-age=300"}.
+# Tiers not listed get FEATURES_CACHE_CONTROL, which makes browsers revalidate with If-None-Match
+FEATURES_CACHE_CONTROL = os.environ.get('FEATURES_CACHE_CONTROL', 'private, no-cache')
+FEATURES_CACHE_CONTROL_BY_TIER = json.loads(os.environ.get('FEATURES_CACHE_CONTROL_BY_TIER') or '{}')
+# tiers whose encoded response fragment is kept for the current configuration version
+FEATURES_RESPONSE_CACHE_SIZE = int(os.environ.get('FEATURES_RESPONSE_CACHE_SIZE', 64))
+# where the configuration is read: appconfig (the AppConfig agent), snapshot (the snapshot files only)
+# or layered (the AppConfig agent, falling back to the snapshot files when it is unavailable)
+CONFIG_STORE = os.environ.get('CONFIG_STORE', 'appconfig').lower()
+# snapshot written by the layered store, then the one bundled with the function
+CONFIG_SNAPSHOT_PATH = os.environ.get('CONFIG_SNAPSHOT_PATH', '/tmp/config.snapshot')
+CONFIG_SNAPSHOT_BUNDLED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.snapshot')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Authorization,If-None-Match',
+    'Access-Control-Expose-Headers': 'ETag'
+}
 
 appconfig_store = AppConfigStoreProvider(
     config_app=CONFIG_APP_NAME,
     config_env=CONFIG_ENV_NAME,
-    config_profile=CONFIG_PROFILE_NAME
+    config_profile=CONFIG_PROFILE_NAME,
+    cache_ttl=CONFIG_CACHE_TTL,
+    agent_port=APPCONFIG_AGENT_PORT
 )
-feature_flags = FeatureFlags(store=appconfig_store)
+snapshot_store = SnapshotStoreProvider(paths=[CONFIG_SNAPSHOT_PATH, CONFIG_SNAPSHOT_BUNDLED_PATH], metrics=appconfig_store.metrics)
+if CONFIG_STORE == 'snapshot':
+    config_store = snapshot_store
+elif CONFIG_STORE == 'layered':
+    config_store = LayeredStoreProvider(primary=appconfig_store, fallback=snapshot_store, snapshot_path=CONFIG_SNAPSHOT_PATH)
+else:
+    config_store = appconfig_store
+feature_flags = FeatureFlags(store=config_store)
+# precomputed tier -> enabled features table, rebuilt when the configuration version changes
+compiled_flags = CompiledFeatureFlags(feature_flags=feature_flags, store=config_store)
+# encoded "tier" and "features" part of the response body per configuration version and tier
+response_cache = ResponseFragmentCache(maxsize=FEATURES_RESPONSE_CACHE_SIZE)
+# response headers without the ETag, per tier
+tier_headers = {}
+
+if PREWARM_ON_INIT:
+    try:
+        compiled_flags.prepare()
+    except Exception as e:
+        logger.warning("Prewarm failed: %s", e)
 
+@metrics.log_metrics
 def lambda_handler(event, context):
+    # the configuration fetch, parse, evaluation and serialization are timed separately,
+    # fetches done by a background refresh are reported by the next invocation
+    timer = PhaseTimer()
+    timer.dimension('Tier', 'none')
+    try:
+        return get_features(event, timer)
+    finally:
+        config_store.metrics.drain_into(timer)
+        compiled_flags.metrics.drain_into(timer)
+        response_cache.metrics.drain_into(timer)
+        timer.emit(metrics, high_resolution=METRICS_HIGH_RESOLUTION)
 
-    logger.info(f'Received Event: {event}')
+def get_features(event, timer):
 
     tenant_id = event['requestContext']['authorizer']['tenant_id']
+    logger.start_invocation(tenant_id=tenant_id)
+
+    logger.debug(lambda: {'received_event': event})
+    logger.debug(lambda: {'http_connections': http_client.stats()})
 
-    logger.structure_logs(append=True, tenant_id=tenant_id)
-    logger.info(f"Processing request for tenant ID: {tenant_id}")
+    logger.append_keys(tenant_id=tenant_id)
+    logger.info("Processing request for tenant ID: %s", tenant_id)
 
     fullname = event['requestContext']['authorizer']['fullname']
     tenant = event['requestContext']['authorizer']['tenant_name']
     tier = event['requestContext']['authorizer'].get("tenant_tier", "basic")
+    timer.dimension('Tier', tier)
+
+    # the response only depends on these values and the configuration, so a client
+    # holding the current ETag is answered before any evaluation
+    try:
+        fingerprint = compiled_flags.current_fingerprint()
+        etag = _etag(fingerprint, fullname, tenant, tier, tenant_id)
+    except ConfigurationStoreError as e:
+        logger.warning("Unable to load configuration, responding without ETag: %s", e)
+        fingerprint = etag = None
+    headers = dict(_tier_headers(tier))
+    if etag is not None:
+        headers['ETag'] = etag
+        if _etag_matches(etag, event.get('headers')):
+            timer.count('NotModified')
+            return {
+                "statusCode": 304,
+                "headers": headers,
+                "body": ""
+            }
+
+    # shared_fragment is '"tier": "basic", "features": ["feature1", "feature2"]}', the same
+    # for every tenant of the tier until the configuration changes, unless conditions
+    # are on other keys than the tier or features target tenants
+    cacheable = fingerprint is not None and compiled_flags.tier_only
+    shared_fragment = response_cache.get(fingerprint, tier) if cacheable else None
+    if shared_fragment is None:
+        features_json = compiled_flags.get_enabled_features_json(context={"tier": tier, "tenant_id": tenant_id}, refresh=fingerprint is None)
+        with timer.phase('Serialize'):
+            shared_fragment = '"tier": %s, "features": %s}' % (json.dumps(tier), features_json)
+        if cacheable:
+            response_cache.put(fingerprint, tier, shared_fragment)
 
-    # all_features is evaluated to ["feature1", "feature2"]
-    all_features = feature_flags.get_enabled_features(context={"tier": tier})
+    logger.info("Enabled features for tenant ID %s: %s", tenant_id, shared_fragment)
+
+    with timer.phase('Serialize'):
+        # same output as json.dumps of the whole dictionary
+        body = '{"fullname": %s, "tenant": %s, %s' % (json.dumps(fullname), json.dumps(tenant), shared_fragment)
 
-    logger.info(f"Enabled features for tenant ID {tenant_id}: {all_features}")
-    
     return {
         "statusCode": 200,
-        "headers": {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET',
-            'Access-Control-Allow-Headers': 'Authorization'
-        },
-        "body": json.dumps({
-            "fullname": fullname,
-            "tenant": tenant,
-            "tier": tier,
-            "features": all_features,
-        })
+        "headers": headers,
+        "body": body
     }
+
+def _tier_headers(tier):
+    headers = tier_headers.get(tier)
+    if headers is None:
+        headers = dict(CORS_HEADERS, **{'Cache-Control': FEATURES_CACHE_CONTROL_BY_TIER.get(tier, FEATURES_CACHE_CONTROL)})
+        # tiers come from the tenant table, the mapping stays small
+        tier_headers[tier] = headers
+    return headers
+
+def _etag(config_fingerprint, fullname, tenant, tier, tenant_id):
+    digest = hashlib.sha256('\0'.join((config_fingerprint, fullname, tenant, tier, tenant_id)).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def _etag_matches(etag, request_headers):
+    # header names are case-insensitive, If-None-Match may list several ETags
+    # and uses the weak comparison
+    if_none_match = next((value for name, value in (request_headers or {}).items() if name.lower() == 'if-none-match'), None)
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from phase_timer import MetricCounters
+
+
+class ResponseFragmentCache:
+    """Pre-encoded JSON fragments of the responses, keyed by configuration version and tier.
+
+    The part of the response body that is the same for every tenant of a tier is
+    encoded once per configuration version, the tenant fields are encoded per request
+    and spliced in front of it. At most `maxsize` tiers are kept, the least recently
+    used one is evicted first, and all entries are dropped when a fragment of a new
+    configuration version is stored."""
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.version: Optional[str] = None
+        self._fragments: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = MetricCounters()
+
+    def get(self, version: str, tier: str) -> Optional[str]:
+        with self._lock:
+            fragment = self._fragments.get(tier) if version == self.version else None
+            if fragment is not None:
+                self._fragments.move_to_end(tier)
+        self.metrics.count('ResponseCacheHits' if fragment is not None else 'ResponseCacheMisses')
+        return fragment
+
+    def put(self, version: str, tier: str, fragment: str):
+        with self._lock:
+            if version != self.version:
+                self._fragments.clear()
+                self.version = version
+            self._fragments[tier] = fragment
+            self._fragments.move_to_end(tier)
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.version = None
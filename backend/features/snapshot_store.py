@@ -0,0 +1,204 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Configuration snapshots, a local alternative to the AppConfig agent.
+
+A snapshot file holds a JSON header line with the version marker, followed by the
+configuration as JSON:
+
+    {"version": "7"}
+    {"analytics": {"default": false, "rules": {...}}, ...}
+
+Snapshots are written to a temporary file that replaces the previous one, so a
+reader sees either the old or the new file, never a partial one. A snapshot can be
+written from a configuration file for bundling with the features function:
+
+    PYTHONPATH=backend/shared python backend/features/snapshot_store.py \\
+        --config features.json --version 7 backend/features/config.snapshot
+"""
+
+import argparse
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.feature_flags.base import StoreProvider
+from aws_lambda_powertools.utilities.feature_flags.exceptions import ConfigurationStoreError
+
+from phase_timer import MetricCounters
+
+logger = Logger(child=True)
+
+
+def write_snapshot(path: str, config: Dict[str, Any], version: Optional[str]):
+    header = json.dumps({"version": version})
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "w") as snapshot_file:
+            snapshot_file.write(header + "\n")
+            json.dump(config, snapshot_file, separators=(",", ":"))
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class SnapshotStoreProvider(StoreProvider):
+    """Configuration read from the first readable snapshot file of `paths`, for
+    example a snapshot written to /tmp by a refresher and the one bundled with the
+    function.
+
+    Each call only compares the inode, size and modification time of the file with
+    those of the snapshot held. When they differ, the header is read through a
+    memory map, and the configuration is parsed again only when its version
+    marker changed."""
+
+    def __init__(self, paths: Sequence[str], metrics: Optional[MetricCounters] = None):
+        super().__init__()
+        self.paths = list(paths)
+        self.config_version: Optional[str] = None
+        self.path: Optional[str] = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._loaded_id = None
+        # file of each path that could not be read
+        self._rejected: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.metrics = metrics if metrics is not None else MetricCounters()
+
+    @staticmethod
+    def _file_id(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _load(self, path: str, file_id):
+        try:
+            with open(path, "rb") as snapshot_file, mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                version = json.loads(mapped.readline())["version"]
+                if self._config is not None and version == self.config_version:
+                    # rewritten with the version we hold, no need to parse it again
+                    self.metrics.count("ConfigUnchanged")
+                else:
+                    start = time.perf_counter()
+                    config = json.loads(mapped[mapped.tell():])
+                    self.metrics.add_duration("ConfigParse", (time.perf_counter() - start) * 1000)
+                    if self._config is not None:
+                        self.metrics.count("ConfigVersionChanges")
+                    self._config = config
+                    self.config_version = version
+        except (OSError, ValueError, KeyError) as exc:
+            raise ConfigurationStoreError(f"Unable to read configuration snapshot {path}") from exc
+        self.path = path
+        self._loaded_id = file_id
+
+    def _get_config(self) -> Dict[str, Any]:
+        error = None
+        for path in self.paths:
+            file_id = self._file_id(path)
+            if file_id is None or self._rejected.get(path) == file_id:
+                continue
+            if path == self.path and file_id == self._loaded_id:
+                self.metrics.count("ConfigCacheHits")
+                return self._config
+            self.metrics.count("ConfigCacheMisses")
+            with self._lock:
+                if path != self.path or file_id != self._loaded_id:
+                    try:
+                        self._load(path, file_id)
+                    except ConfigurationStoreError as exc:
+                        # a corrupt snapshot falls through to the next one, and is not
+                        # read again until it is replaced
+                        logger.warning(f"{exc}: {exc.__cause__}")
+                        self._rejected[path] = file_id
+                        error = exc
+                        continue
+            return self._config
+        raise ConfigurationStoreError(f"No readable configuration snapshot in {self.paths}") from error
+
+    def get_configuration(self) -> Dict[str, Any]:
+        return self._get_config()
+
+    @property
+    def get_raw_configuration(self) -> Dict[str, Any]:
+        return self._get_config()
+
+
+class LayeredStoreProvider(StoreProvider):
+    """Configuration of the `primary` store, or of the `fallback` snapshot store when
+    the primary store is unavailable.
+
+    Each new version loaded from the primary store is written to `snapshot_path` in
+    the background, so an execution environment keeps its latest configuration when
+    the primary store fails later on. Both stores add to the same `metrics`."""
+
+    def __init__(self, primary: StoreProvider, fallback: SnapshotStoreProvider, snapshot_path: Optional[str] = None):
+        super().__init__()
+        self.primary = primary
+        self.fallback = fallback
+        self.snapshot_path = snapshot_path
+        self.config_version: Optional[str] = None
+        self.metrics = primary.metrics
+        self._written_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _write_snapshot(self, config: Dict[str, Any], version: str):
+        try:
+            write_snapshot(self.snapshot_path, config, version)
+        except OSError as exc:
+            logger.warning(f"Unable to write configuration snapshot {self.snapshot_path}: {exc}")
+            with self._lock:
+                self._written_version = None
+
+    def _get_config(self) -> Dict[str, Any]:
+        try:
+            config = self.primary.get_configuration()
+            version = self.primary.config_version
+        except ConfigurationStoreError as exc:
+            self.metrics.count("SnapshotFallbacks")
+            logger.warning(f"Configuration store unavailable, using the snapshot: {exc}")
+            config = self.fallback.get_configuration()
+            self.config_version = self.fallback.config_version
+            return config
+
+        self.config_version = version
+        if self.snapshot_path and version is not None:
+            with self._lock:
+                write = version != self._written_version
+                if write:
+                    self._written_version = version
+            if write:
+                threading.Thread(target=self._write_snapshot, args=(config, version), daemon=True).start()
+        return config
+
+    def get_configuration(self) -> Dict[str, Any]:
+        return self._get_config()
+
+    @property
+    def get_raw_configuration(self) -> Dict[str, Any]:
+        return self._get_config()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a feature flags configuration snapshot")
+    parser.add_argument("output", help="snapshot file to write")
+    parser.add_argument("--config", required=True, help="feature flags configuration file")
+    parser.add_argument("--version", required=True, help="version marker of the snapshot")
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    write_snapshot(args.output, config, args.version)
+
+
+if __name__ == "__main__":
+    main()
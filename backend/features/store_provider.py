@@ -2,16 +2,21 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
-import requests
-from typing import Any, Dict
-
-from botocore.exceptions import ClientError
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.feature_flags.base import StoreProvider
 from aws_lambda_powertools.utilities.feature_flags.exceptions import ConfigurationStoreError
 
+import http_client
+from phase_timer import MetricCounters
+
+logger = Logger(child=True)
+
 class AppConfigStoreProvider(StoreProvider):
-    def __init__(self, config_app: str, config_env: str, config_profile: str):
+    def __init__(self, config_app: str, config_env: str, config_profile: str, cache_ttl: Optional[float] = None, agent_port: int = 2772):
         # Initialize the client to your custom store provider
 
         super().__init__()
@@ -19,18 +24,85 @@ class AppConfigStoreProvider(StoreProvider):
         self.config_app = config_app
         self.config_env = config_env
         self.config_profile = config_profile
+        self.agent_port = agent_port
+
+        # When cache_ttl is set, the parsed configuration is kept for cache_ttl seconds.
+        # Once it is older, it is still served while a single background refresh runs,
+        # so requests only wait for the AppConfig agent on the very first load.
+        self.cache_ttl = cache_ttl
+        self.config_version: Optional[str] = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        # fetch and parse times, cache hits and version changes, drained by the handler
+        self.metrics = MetricCounters()
+
+    def _fetch_config(self) -> Tuple[Optional[str], Dict[str, Any]]:
+        import requests
 
-    def _get_config(self) -> Dict[str, Any]:
         # Retrieve the config
-        url = f'http://localhost:2772/applications/{self.config_app}/environments/{self.config_env}/configurations/{self.config_profile}'
+        url = f'http://localhost:{self.agent_port}/applications/{self.config_app}/environments/{self.config_env}/configurations/{self.config_profile}'
 
         try:
-            response = requests.get(url, timeout=3)
-            config = response.text
-            return json.loads(config)
-        except ClientError as exc:
+            # keep-alive connection pool to the AppConfig agent
+            start = time.perf_counter()
+            response = http_client.get_client('appconfig').get(url)
+            response.raise_for_status()
+            self.metrics.add_duration('ConfigFetch', (time.perf_counter() - start) * 1000)
+            version = response.headers.get('Configuration-Version')
+            if version is not None and version == self.config_version and self._config is not None:
+                # same version as the one we hold, no need to parse it again
+                self.metrics.count('ConfigUnchanged')
+                return version, self._config
+            start = time.perf_counter()
+            config = json.loads(response.text)
+            self.metrics.add_duration('ConfigParse', (time.perf_counter() - start) * 1000)
+            return version, config
+        except (requests.RequestException, ValueError) as exc:
             raise ConfigurationStoreError("Unable to get AppConfig Store Provider configuration file") from exc
 
+    def _load_config(self):
+        version, config = self._fetch_config()
+        if self._config is not None and version != self.config_version:
+            self.metrics.count('ConfigVersionChanges')
+        self._config = config
+        self.config_version = version
+        self._fetched_at = time.monotonic()
+
+    def _refresh_config(self):
+        try:
+            self._load_config()
+        except ConfigurationStoreError as exc:
+            # keep serving the stale configuration, retry once the TTL expires again
+            logger.warning(f"Unable to refresh configuration, serving version {self.config_version}: {exc}")
+            self._fetched_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def _get_config(self) -> Dict[str, Any]:
+        if self.cache_ttl is None:
+            self.metrics.count('ConfigCacheMisses')
+            self._load_config()
+            return self._config
+
+        if self._config is None:
+            self.metrics.count('ConfigCacheMisses')
+            with self._lock:
+                if self._config is None:
+                    self._load_config()
+            return self._config
+
+        self.metrics.count('ConfigCacheHits')
+        if time.monotonic() - self._fetched_at >= self.cache_ttl:
+            with self._lock:
+                start_refresh = not self._refreshing
+                self._refreshing = True
+            if start_refresh:
+                threading.Thread(target=self._refresh_config, daemon=True).start()
+
+        return self._config
+
     def get_configuration(self) -> Dict[str, Any]:
         return self._get_config()
 
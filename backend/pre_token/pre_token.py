@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+
+from botocore.exceptions import ClientError
+
+from sampled_logging import get_logger
+
+logger = get_logger()
+
+# Constants
+REGION = os.environ['AWS_REGION']
+TENANT_METADATA_TABLE_NAME = os.environ['TENANT_METADATA_TABLE_NAME']
+# tenant metadata added to the ID token, the authorizer reads the same claims
+TENANT_CLAIMS = ('tenant_name', 'tenant_tier', 'fullname')
+
+# AWS service clients, boto3 is only imported when the table is first needed
+tenant_metadata_table = None
+
+def _get_tenant_metadata_table():
+    global tenant_metadata_table
+    if tenant_metadata_table is None:
+        import boto3
+        dynamodb = boto3.resource('dynamodb', region_name=REGION)
+        tenant_metadata_table = dynamodb.Table(TENANT_METADATA_TABLE_NAME)
+    return tenant_metadata_table
+
+def lambda_handler(event, context):
+    # Cognito pre token generation trigger, invoked when tokens are issued or refreshed.
+    # The tenant metadata becomes signed claims of the ID token, so the authorizer
+    # does not need to read it from DynamoDB on every request
+    logger.start_invocation()
+    logger.debug(lambda: {'received_event': event})
+
+    tenant_id = event['request']['userAttributes'].get('custom:tenant_id')
+    if not tenant_id:
+        logger.warning("User has no tenant ID, issuing tokens without tenant claims")
+        return event
+    logger.set_tenant(tenant_id)
+
+    # a failed lookup must not fail the sign-in, the authorizer falls back to
+    # reading the tenant metadata for tokens without the claims
+    try:
+        item = _get_tenant_metadata_table().get_item(
+            Key={'tenant_id': tenant_id},
+            ProjectionExpression=', '.join(TENANT_CLAIMS)
+        ).get('Item')
+    except ClientError as e:
+        logger.error("Unable to read tenant metadata, issuing tokens without tenant claims: %s", e)
+        return event
+    if item is None or any(claim not in item for claim in TENANT_CLAIMS):
+        logger.warning("Tenant %s not found, issuing tokens without tenant claims", tenant_id)
+        return event
+
+    event['response']['claimsOverrideDetails'] = {
+        'claimsToAddOrOverride': {claim: str(item[claim]) for claim in TENANT_CLAIMS}
+    }
+    logger.info("Added tenant claims for tenant ID %s, tier %s", tenant_id, item['tenant_tier'])
+    return event
@@ -3,9 +3,16 @@
 
 import json
 import os
+import random
+import threading
+import time
 import uuid
-import boto3
-import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from registration_queue import DynamoDbStatusStore, SqsRegistrationQueue, QUEUED
+from sampled_logging import get_logger
 
 # Constants
 REGION = os.environ['AWS_REGION']
@@ -13,30 +20,85 @@ USER_POOL_ID = os.environ['USER_POOL_ID']
 TENANT_METADATA_TABLE_NAME = os.environ['TENANT_METADATA_TABLE_NAME']
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Methods': 'POST',
+    'Access-Control-Allow-Methods': 'GET,POST',
     'Access-Control-Allow-Headers': 'Content-Type'
 }
+REQUIRED_FIELDS = ('email', 'given_name', 'family_name', 'tenant_name', 'tenant_tier')
+
+# Bulk registration settings
+BULK_MAX_WORKERS = int(os.environ.get('BULK_MAX_WORKERS', 8))
+# stay below the AdminCreateUser quota so the signup page keeps working during a migration
+BULK_COGNITO_RPS = float(os.environ.get('BULK_COGNITO_RPS', 25))
+BULK_MAX_ATTEMPTS = int(os.environ.get('BULK_MAX_ATTEMPTS', 4))
+# stop starting new records when less time than this is left in the invocation
+BULK_SAFETY_MARGIN_MS = int(os.environ.get('BULK_SAFETY_MARGIN_MS', 10000))
+RETRYABLE_ERRORS = ('TooManyRequestsException', 'LimitExceededException', 'ThrottlingException', 'InternalErrorException')
+
+# Asynchronous registration settings
+ASYNC_REGISTRATION = os.environ.get('ASYNC_REGISTRATION', 'false').lower() == 'true'
+REGISTRATION_QUEUE_URL = os.environ.get('REGISTRATION_QUEUE_URL')
+REGISTRATION_STATUS_TABLE_NAME = os.environ.get('REGISTRATION_STATUS_TABLE_NAME')
+# create the AWS service clients during the INIT phase instead of the first request
+PREWARM_ON_INIT = os.environ.get('PREWARM_ON_INIT', 'false').lower() == 'true'
+
+# AWS service clients, created by init_clients
+cognito = None
+tenant_metadata_table = None
+
+# Pending registrations and their status, set to the in-memory stand-ins
+# of registration_queue for local runs and tests
+registration_queue = None
+registration_status = None
+_clients_initialized = False
 
-# AWS service clients
-cognito = boto3.client('cognito-idp', region_name=REGION)
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
+logger = get_logger()
 
-tenant_metadata_table = dynamodb.Table(TENANT_METADATA_TABLE_NAME)
+def init_clients():
+    """Creates the AWS service clients that have not been set yet. boto3 is only
+    imported here, so that it is loaded on first use unless PREWARM_ON_INIT is set."""
+    global cognito, tenant_metadata_table, registration_queue, registration_status, _clients_initialized
+    if _clients_initialized:
+        return
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+    import boto3
+    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    if cognito is None:
+        cognito = boto3.client('cognito-idp', region_name=REGION)
+    if tenant_metadata_table is None:
+        tenant_metadata_table = dynamodb.Table(TENANT_METADATA_TABLE_NAME)
+    if registration_queue is None and REGISTRATION_QUEUE_URL:
+        registration_queue = SqsRegistrationQueue(boto3.client('sqs', region_name=REGION), REGISTRATION_QUEUE_URL)
+    if registration_status is None and REGISTRATION_STATUS_TABLE_NAME:
+        registration_status = DynamoDbStatusStore(dynamodb.Table(REGISTRATION_STATUS_TABLE_NAME))
+    _clients_initialized = True
+
+if PREWARM_ON_INIT:
+    init_clients()
 
 def lambda_handler(event, context):
 
-    logger.info('Received Event: %s', event)
+    init_clients()
+    logger.start_invocation()
+
+    if 'tenants' in event:
+        # bulk registration, only available through direct invocation
+        return _register_bulk(event['tenants'], context)
+
+    logger.debug(lambda: {'received_event': event})
+
+    if event.get('httpMethod') == 'GET':
+        return _get_registration_status(event)
 
     body = json.loads(event['body'])
+    if ASYNC_REGISTRATION:
+        return _enqueue_registration(body)
+
     tenant_id = str(uuid.uuid4())
     response={}
 
     try:
         _create_cognito_user(body, tenant_id)
-        logger.info(f"Succesfully created user {tenant_id}.")
+        logger.info("Succesfully created user %s.", tenant_id)
 
         _create_tenant_metadata(body, tenant_id)
         logger.info("Succesfully written details to DynamoDB.")
@@ -47,7 +109,7 @@ def lambda_handler(event, context):
             'body': json.dumps({'message': f"User registered successfully. Please check your email at {body['email']} for the password."})
         }
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         
         response = {
             'statusCode': 500,
@@ -57,6 +119,62 @@ def lambda_handler(event, context):
 
     return response
 
+def _enqueue_registration(body: dict):
+    missing = [field for field in REQUIRED_FIELDS if not body.get(field)]
+    if missing:
+        return {
+            'statusCode': 400,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'message': f"Missing fields: {', '.join(missing)}"})
+        }
+
+    tracking_id = str(uuid.uuid4())
+    tenant_id = str(uuid.uuid4())
+    try:
+        # the status is recorded first so it can be reported as soon as the request is accepted
+        registration_status.put(tracking_id, QUEUED)
+        registration_queue.send({'tracking_id': tracking_id, 'tenant_id': tenant_id, 'registration': body})
+        logger.info("Queued registration %s for tenant %s.", tracking_id, tenant_id)
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+        return {
+            'statusCode': 500,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'message': f"An error occurred: {e}"})
+        }
+
+    return {
+        'statusCode': 202,
+        'headers': CORS_HEADERS,
+        'body': json.dumps({
+            'message': f"Registration received. Once it is processed, please check your email at {body['email']} for the password.",
+            'tracking_id': tracking_id
+        })
+    }
+
+def _get_registration_status(event: dict):
+    tracking_id = (event.get('pathParameters') or {}).get('tracking_id')
+    item = registration_status.get(tracking_id) if tracking_id else None
+    if item is None:
+        return {
+            'statusCode': 404,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'message': 'Registration not found'})
+        }
+
+    status = {
+        'tracking_id': tracking_id,
+        'status': item['status'],
+        'updated_at': int(item['updated_at'])
+    }
+    if 'error' in item:
+        status['error'] = item['error']
+    return {
+        'statusCode': 200,
+        'headers': CORS_HEADERS,
+        'body': json.dumps(status)
+    }
+
 def _create_cognito_user(event: dict, tenant_id: str):
     cognito.admin_create_user(
         UserPoolId=USER_POOL_ID,
@@ -71,11 +189,134 @@ def _create_cognito_user(event: dict, tenant_id: str):
 
 def _create_tenant_metadata(event: dict, tenant_id: str):
     tenant_metadata_table.put_item(
-        Item={
-            'tenant_id': tenant_id,
-            'tenant_name': event['tenant_name'],
-            'tenant_tier': event['tenant_tier'],
-            'fullname': f"{event['given_name']} {event['family_name']}"
-        },
+        Item=_tenant_metadata_item(event, tenant_id),
         ConditionExpression='attribute_not_exists(tenant_id)'
     )
+
+def _tenant_metadata_item(event: dict, tenant_id: str) -> dict:
+    return {
+        'tenant_id': tenant_id,
+        'tenant_name': event['tenant_name'],
+        'tenant_tier': event['tenant_tier'],
+        'fullname': f"{event['given_name']} {event['family_name']}"
+    }
+
+class _RateLimiter:
+    """Spaces calls evenly so that at most `rate` calls per second start, across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def _with_retries(call, *args, **kwargs):
+    """Calls `call`, retrying throttling and transient errors with exponential backoff
+    and full jitter. Returns the number of attempts made."""
+    for attempt in range(1, BULK_MAX_ATTEMPTS + 1):
+        try:
+            call(*args, **kwargs)
+            return attempt
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERRORS or attempt == BULK_MAX_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+def _create_bulk_cognito_user(event: dict, tenant_id: str) -> int:
+    """Creates the user with retries. Returns the number of attempts made."""
+    attempts = 0
+
+    def create():
+        nonlocal attempts
+        attempts += 1
+        try:
+            _create_cognito_user(event, tenant_id)
+        except ClientError as e:
+            # a retried call can fail because an earlier attempt created the user before failing
+            if attempts > 1 and _created_earlier(e, event, tenant_id):
+                logger.info("User %s was created by an earlier attempt", event['email'])
+                return
+            raise
+
+    return _with_retries(create)
+
+def _created_earlier(error: ClientError, event: dict, tenant_id: str) -> bool:
+    """Whether AdminCreateUser failed because the user exists with the tenant ID of this
+    registration, created by an earlier attempt, rather than by another registration."""
+    return error.response['Error']['Code'] == 'UsernameExistsException' and _cognito_tenant_id(event['email']) == tenant_id
+
+def _cognito_tenant_id(username: str):
+    user = cognito.admin_get_user(UserPoolId=USER_POOL_ID, Username=username)
+    return next((attribute['Value'] for attribute in user.get('UserAttributes', []) if attribute['Name'] == 'custom:tenant_id'), None)
+
+def _register_bulk(tenants: list, context) -> dict:
+    """Registers a list of tenants. Cognito users are created by a bounded pool of
+    workers sharing a rate limit, then the metadata of the created tenants is written
+    with batch writes. Users whose metadata could not be written are deleted again so
+    that no tenant is left half registered. Returns one result per input record, in order."""
+    logger.info("Received bulk registration of %d tenants", len(tenants))
+    results = [{'index': index, 'email': tenant.get('email') if isinstance(tenant, dict) else None} for index, tenant in enumerate(tenants)]
+    rate_limiter = _RateLimiter(BULK_COGNITO_RPS)
+
+    def create_user(index):
+        tenant, result = tenants[index], results[index]
+        if context is not None and context.get_remaining_time_in_millis() < BULK_SAFETY_MARGIN_MS:
+            result.update(status='skipped', error='Not started before the invocation timeout, submit again')
+            return
+        tenant_id = str(uuid.uuid4())
+        rate_limiter.acquire()
+        try:
+            result['attempts'] = _create_bulk_cognito_user(tenant, tenant_id)
+            result.update(status='user_created', tenant_id=tenant_id)
+        except Exception as e:
+            result.update(status='failed', error=str(e))
+
+    valid = []
+    for index, tenant in enumerate(tenants):
+        missing = [field for field in REQUIRED_FIELDS if not isinstance(tenant, dict) or not tenant.get(field)]
+        if missing:
+            results[index].update(status='failed', error=f"Missing fields: {', '.join(missing)}")
+        else:
+            valid.append(index)
+
+    with ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS) as executor:
+        list(executor.map(create_user, valid))
+
+    created = [index for index in valid if results[index]['status'] == 'user_created']
+    # one batch write per chunk, so a failure is attributed to the records of its chunk
+    for start in range(0, len(created), 25):
+        chunk = created[start:start + 25]
+        try:
+            with tenant_metadata_table.batch_writer() as batch:
+                for index in chunk:
+                    batch.put_item(Item=_tenant_metadata_item(tenants[index], results[index]['tenant_id']))
+        except Exception as e:
+            logger.error("Unable to write tenant metadata, removing %d users: %s", len(chunk), e)
+            for index in chunk:
+                results[index].update(status='failed', error=f"Unable to write tenant metadata: {e}")
+                results[index]['compensated'] = _delete_cognito_user(tenants[index])
+        else:
+            for index in chunk:
+                results[index]['status'] = 'registered'
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    logger.info("Bulk registration finished: %s", summary)
+    return {'summary': summary, 'results': results}
+
+def _delete_cognito_user(event: dict) -> bool:
+    # compensation for a tenant whose registration could not be completed
+    try:
+        _with_retries(cognito.admin_delete_user, UserPoolId=USER_POOL_ID, Username=event['email'])
+        return True
+    except Exception as e:
+        logger.error("Unable to remove user %s after a failed registration: %s", event['email'], e)
+        return False
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Registration statuses, in the order a registration goes through them
+QUEUED = 'queued'
+USER_CREATED = 'user_created'
+REGISTERED = 'registered'
+FAILED = 'failed'
+
+# status records are removed by DynamoDB TTL after this many seconds
+STATUS_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class SqsRegistrationQueue:
+    """Queue of pending registrations backed by Amazon SQS. Messages are consumed by
+    the registration worker through its SQS event source."""
+
+    def __init__(self, sqs_client, queue_url: str):
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+
+    def send(self, message: Dict[str, Any]):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+
+
+class InMemoryRegistrationQueue:
+    """Stand-in for `SqsRegistrationQueue` used for local runs and tests. Received
+    messages have the same shape as the records of an SQS event."""
+
+    def __init__(self):
+        self._messages = deque()
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]):
+        with self._lock:
+            self._messages.append({'messageId': str(uuid.uuid4()), 'body': json.dumps(message)})
+
+    def receive(self, max_messages: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._messages.popleft() for _ in range(min(max_messages, len(self._messages)))]
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class DynamoDbStatusStore:
+    """Registration status records in a DynamoDB table keyed by `tracking_id`."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def put(self, tracking_id: str, status: str, **fields: Any):
+        now = int(time.time())
+        self.table.put_item(Item={
+            'tracking_id': tracking_id,
+            'status': status,
+            'updated_at': now,
+            'expires_at': now + STATUS_RETENTION_SECONDS,
+            **fields
+        })
+
+    def get(self, tracking_id: str) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(Key={'tracking_id': tracking_id}).get('Item')
+
+
+class InMemoryStatusStore:
+    """Stand-in for `DynamoDbStatusStore` used for local runs and tests."""
+
+    def __init__(self):
+        self._items: Dict[str, Dict[str, Any]] = {}
+
+    def put(self, tracking_id: str, status: str, **fields: Any):
+        self._items[tracking_id] = {'tracking_id': tracking_id, 'status': status, 'updated_at': int(time.time()), **fields}
+
+    def get(self, tracking_id: str) -> Optional[Dict[str, Any]]:
+        return self._items.get(tracking_id)
@@ -0,0 +1,100 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+
+from botocore.exceptions import ClientError
+
+import register
+from register import _create_cognito_user, _create_tenant_metadata, _created_earlier, _delete_cognito_user, logger, RETRYABLE_ERRORS
+from registration_queue import QUEUED, USER_CREATED, REGISTERED, FAILED
+
+def lambda_handler(event, context):
+    # SQS event source with partial batch responses, only the messages listed
+    # in batchItemFailures are delivered again
+    register.init_clients()
+    logger.start_invocation()
+    return process_batch(event['Records'])
+
+def process_batch(records: list) -> dict:
+    failures = []
+    for record in records:
+        if not _process_registration(json.loads(record['body'])):
+            failures.append({'itemIdentifier': record['messageId']})
+    logger.info("Processed %d registrations, %d to retry.", len(records), len(failures))
+    return {'batchItemFailures': failures}
+
+def drain(queue, batch_size: int = 10, max_rounds: int = 5) -> int:
+    """Processes the messages of an InMemoryRegistrationQueue in batches until it is
+    empty. Messages to retry are queued again, for at most `max_rounds` batches per
+    message. Returns the number of batches processed."""
+    register.init_clients()
+    batches = 0
+    rounds = {}
+    while len(queue) > 0:
+        records = queue.receive(batch_size)
+        retry_ids = {failure['itemIdentifier'] for failure in process_batch(records)['batchItemFailures']}
+        batches += 1
+        for record in records:
+            if record['messageId'] in retry_ids:
+                message = json.loads(record['body'])
+                rounds[message['tracking_id']] = rounds.get(message['tracking_id'], 1) + 1
+                if rounds[message['tracking_id']] <= max_rounds:
+                    queue.send(message)
+    return batches
+
+def _process_registration(message: dict) -> bool:
+    """Runs the remaining steps of a registration. Returns False when the message
+    should be delivered again."""
+    tracking_id = message['tracking_id']
+    tenant_id = message['tenant_id']
+    registration = message['registration']
+
+    status = register.registration_status
+    current = status.get(tracking_id)
+    current_status = current['status'] if current else QUEUED
+    if current_status in (REGISTERED, FAILED):
+        # already processed, the message was delivered more than once
+        return True
+
+    # a user without tenant metadata is removed when the registration fails
+    user_without_metadata = current_status == USER_CREATED
+    try:
+        if not user_without_metadata:
+            try:
+                _create_cognito_user(registration, tenant_id)
+                logger.info("Succesfully created user %s.", tenant_id)
+            except ClientError as e:
+                # an earlier delivery created the user but did not record it
+                if not _created_earlier(e, registration, tenant_id):
+                    raise
+                logger.info("User %s was created by an earlier delivery.", tenant_id)
+            user_without_metadata = True
+            status.put(tracking_id, USER_CREATED)
+
+        try:
+            _create_tenant_metadata(registration, tenant_id)
+        except ClientError as e:
+            # written by an earlier delivery of this message
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        user_without_metadata = False
+        logger.info("Succesfully written details to DynamoDB.")
+        status.put(tracking_id, REGISTERED)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in RETRYABLE_ERRORS:
+            logger.warning("Registration %s will be retried: %s", tracking_id, e)
+            return False
+        return _fail(tracking_id, registration, user_without_metadata, e)
+    except Exception as e:
+        return _fail(tracking_id, registration, user_without_metadata, e)
+
+def _fail(tracking_id: str, registration: dict, user_without_metadata: bool, error: Exception) -> bool:
+    logger.error("An error occurred: %s", error)
+    fields = {'error': str(error)}
+    if user_without_metadata:
+        # the registration can then be submitted again
+        fields['compensated'] = _delete_cognito_user(registration)
+    register.registration_status.put(tracking_id, FAILED, **fields)
+    return True
@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+# Defaults, can be tuned per function through environment variables
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 4))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 2))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 3))
+
+
+class PooledHttpClient:
+    """HTTP client backed by a persistent `requests.Session`.
+
+    Connections are kept alive and reused across requests and warm invocations,
+    which saves the TCP (and TLS) handshake of every call after the first one.
+    `pool_connections` is the number of hosts to keep pools for, `pool_maxsize`
+    the number of connections kept per host. `requests` is only imported when the
+    first client is created, to keep it out of the import time of the handlers."""
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+    def get(self, url: str, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the request and connection counters of the pools currently open.
+        `connections_reused` is the number of requests that did not need a new connection."""
+        requests_sent = 0
+        connections_opened = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            connections_opened += pool.num_connections
+        return {
+            'requests': requests_sent,
+            'connections_opened': connections_opened,
+            'connections_reused': requests_sent - connections_opened
+        }
+
+
+_clients: Dict[str, PooledHttpClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str, **kwargs: Any) -> PooledHttpClient:
+    """Returns the process-wide client registered under `name`, creating it with
+    `kwargs` on first use. Clients live for the lifetime of the execution environment."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = PooledHttpClient(**kwargs)
+                _clients[name] = client
+    return client
+
+
+def stats(name: Optional[str] = None) -> Dict[str, Any]:
+    """Returns the connection counters of one client, or of all clients by name."""
+    if name is not None:
+        return _clients[name].stats()
+    return {client_name: client.stats() for client_name, client in list(_clients.items())}
@@ -0,0 +1,87 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from aws_lambda_powertools.metrics import MetricResolution, MetricUnit
+
+
+class PhaseTimer:
+    """Durations of the named phases of one invocation, counters and dimensions,
+    emitted together as CloudWatch embedded metric format (EMF) metrics through a
+    Powertools `Metrics` instance.
+
+    Each phase becomes a `<Phase>Time` metric in milliseconds. Cache outcomes and
+    the other dimensions apply to every metric of the invocation, so their values
+    must stay low cardinality (a tier, never a tenant ID)."""
+
+    __slots__ = ('durations', 'counts', 'dimensions', '_started')
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, float] = {}
+        self.dimensions: Dict[str, str] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(name, (time.perf_counter() - start) * 1000)
+
+    def add_duration(self, name: str, milliseconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + milliseconds
+
+    def count(self, name: str, value: float = 1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def dimension(self, name: str, value: str):
+        """Sets a dimension of the emitted metrics, such as the outcome ('hit', 'miss',
+        ...) of a cache."""
+        self.dimensions[name] = value
+
+    def emit(self, metrics, high_resolution: bool = False, total: Optional[str] = 'Total'):
+        """Adds the collected metrics to `metrics`, with the total time since the timer
+        was created as `<total>Time`. Flushing is left to `metrics.log_metrics`."""
+        resolution = MetricResolution.High if high_resolution else MetricResolution.Standard
+        if total:
+            self.add_duration(total, (time.perf_counter() - self._started) * 1000)
+        for name, value in self.dimensions.items():
+            metrics.add_dimension(name=name, value=str(value))
+        for name, milliseconds in self.durations.items():
+            metrics.add_metric(name=f'{name}Time', unit=MetricUnit.Milliseconds, value=milliseconds, resolution=resolution)
+        for name, value in self.counts.items():
+            metrics.add_metric(name=name, unit=MetricUnit.Count, value=value, resolution=resolution)
+
+
+class MetricCounters:
+    """Thread-safe durations and counts accumulated by a long-lived object, such as a
+    configuration store refreshing in the background, until the next invocation
+    moves them into its `PhaseTimer`."""
+
+    def __init__(self):
+        self._durations: Dict[str, float] = {}
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_duration(self, name: str, milliseconds: float):
+        with self._lock:
+            self._durations[name] = self._durations.get(name, 0.0) + milliseconds
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def drain_into(self, timer: PhaseTimer):
+        with self._lock:
+            durations, self._durations = self._durations, {}
+            counts, self._counts = self._counts, {}
+        for name, milliseconds in durations.items():
+            timer.add_duration(name, milliseconds)
+        for name, value in counts.items():
+            timer.count(name, value)
@@ -0,0 +1,152 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import os
+import random
+from typing import Any, Dict, Iterable, Optional
+
+from aws_lambda_powertools import Logger
+
+REDACTED = '***'
+
+# fields never written to the logs in clear, matched case-insensitively at any depth
+DEFAULT_REDACTED_FIELDS = (
+    'authorization',
+    'authorizationToken',
+    'cognito:username',
+    'email',
+    'family_name',
+    'fullname',
+    'given_name',
+)
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL,
+}
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[int, float]:
+    """Parses 'INFO=0.1,DEBUG=0.01' into {logging.INFO: 0.1, logging.DEBUG: 0.01}."""
+    rates = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        level, _, rate = item.partition('=')
+        level = level.strip().upper()
+        if level not in LEVELS:
+            raise ValueError(f"Unknown log level {level} in LOG_SAMPLE_RATES")
+        rates[LEVELS[level]] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def _split(value: Optional[str]) -> list:
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def redact(value: Any, fields: frozenset) -> Any:
+    """Returns a copy of `value` where dictionary entries named in `fields` are masked."""
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in fields else redact(item, fields) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+class SampledLogger:
+    """Powertools `Logger` wrapper that keeps log volume and formatting cost down.
+
+    - Sampling: each level has a sample rate (`LOG_SAMPLE_RATES`, e.g.
+      'INFO=0.05,WARNING=0.5'). The decision is taken once per invocation in
+      `start_invocation`, so a sampled invocation logs all its lines of that level
+      and the others log none. Levels without a rate are always logged.
+    - Lazy messages: messages are only built for lines that are written. Pass
+      %-style arguments, or a callable returning the message.
+    - Redaction: dictionary messages and extra fields have the entries named in
+      `LOG_REDACTED_FIELDS` (added to the defaults) masked before they are written.
+    - Debug override: invocations for a tenant listed in `LOG_DEBUG_TENANTS` log
+      every line at every level, including DEBUG.
+
+    Other attributes are those of the wrapped `Logger`."""
+
+    def __init__(self, logger: Logger, sample_rates: Optional[Dict[int, float]] = None,
+                 redacted_fields: Iterable[str] = DEFAULT_REDACTED_FIELDS, debug_tenants: Iterable[str] = ()):
+        self.logger = logger
+        self.sample_rates = dict(sample_rates or {})
+        self.redacted_fields = frozenset(field.lower() for field in redacted_fields)
+        self.debug_tenants = frozenset(debug_tenants)
+        self.base_level = logger.log_level
+        self._sampled_out = set()
+        self._debug_override = False
+
+    def start_invocation(self, tenant_id: Optional[str] = None):
+        """Draws the sampling decisions of a new invocation."""
+        self._sampled_out = {level for level, rate in self.sample_rates.items() if rate < 1.0 and random.random() >= rate}
+        self._set_debug_override(False)
+        if tenant_id is not None:
+            self.set_tenant(tenant_id)
+
+    def set_tenant(self, tenant_id: str):
+        """Applies the debug override once the tenant of the invocation is known."""
+        if tenant_id in self.debug_tenants:
+            self._set_debug_override(True)
+
+    def is_enabled_for(self, level: int) -> bool:
+        if self._debug_override:
+            return True
+        return level not in self._sampled_out and level >= self.logger.log_level
+
+    def debug(self, msg: Any, *args: Any, **fields: Any):
+        self._log(logging.DEBUG, msg, args, fields)
+
+    def info(self, msg: Any, *args: Any, **fields: Any):
+        self._log(logging.INFO, msg, args, fields)
+
+    def warning(self, msg: Any, *args: Any, **fields: Any):
+        self._log(logging.WARNING, msg, args, fields)
+
+    def error(self, msg: Any, *args: Any, **fields: Any):
+        self._log(logging.ERROR, msg, args, fields)
+
+    def exception(self, msg: Any, *args: Any, **fields: Any):
+        if self.is_enabled_for(logging.ERROR):
+            self.logger.exception(*self._prepare(msg, args, fields), stacklevel=3)
+
+    def __getattr__(self, name: str):
+        return getattr(self.logger, name)
+
+    def _log(self, level: int, msg: Any, args: tuple, fields: Dict[str, Any]):
+        if not self.is_enabled_for(level):
+            return
+        message, args, extra = self._prepare(msg, args, fields)
+        # stacklevel points the location of the line at the caller of debug, info, ...
+        getattr(self.logger, logging.getLevelName(level).lower())(message, *args, extra=extra, stacklevel=4)
+
+    def _prepare(self, msg: Any, args: tuple, fields: Dict[str, Any]):
+        if callable(msg):
+            msg = msg()
+        if isinstance(msg, (dict, list, tuple)):
+            msg = redact(msg, self.redacted_fields)
+        extra = redact(fields, self.redacted_fields) if fields else None
+        return msg, args, extra
+
+    def _set_debug_override(self, enabled: bool):
+        if enabled == self._debug_override:
+            return
+        self._debug_override = enabled
+        self.logger.setLevel(logging.DEBUG if enabled else self.base_level)
+
+
+def get_logger(**kwargs: Any) -> SampledLogger:
+    """Creates a `SampledLogger` configured from the LOG_SAMPLE_RATES, LOG_REDACTED_FIELDS
+    and LOG_DEBUG_TENANTS environment variables. Keyword arguments go to `Logger`."""
+    return SampledLogger(
+        Logger(**kwargs),
+        sample_rates=parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES')),
+        redacted_fields=DEFAULT_REDACTED_FIELDS + tuple(_split(os.environ.get('LOG_REDACTED_FIELDS'))),
+        debug_tenants=_split(os.environ.get('LOG_DEBUG_TENANTS'))
+    )
@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Offline throughput and latency benchmark of the three backend functions.
+
+The authorizer, features and register handlers are imported in this process with
+their endpoints pointed at the local stubs in benchmarks/stubs.py, then synthetic
+API Gateway events are replayed against each of them from a thread pool. For each
+handler the run reports latency percentiles and invocations per second.
+
+    python -m benchmarks.e2e --requests 2000 --concurrency 8
+    python -m benchmarks.e2e --latency-ms dynamodb=5 --latency-ms jwks=40
+    python -m benchmarks.e2e --tenant-claims
+    python -m benchmarks.e2e --output current.json --baseline baseline.json --max-regression 0.2
+
+With --baseline the command exits with status 1 when a handler's p95 latency grew,
+or its throughput dropped, by more than --max-regression (a fraction) compared to
+the results saved by an earlier run with --output, so it can gate CI.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from benchmarks import fixtures
+from benchmarks.stubs import StubBackend
+
+# default injected latency per service, in milliseconds
+DEFAULT_LATENCY_MS = {
+    'jwks': 30.0,
+    'appconfig': 1.0,
+    'dynamodb': 4.0,
+    'cognito': 20.0,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def replay(handler: Callable, events: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    context = fixtures.LambdaContext()
+
+    def invoke(event):
+        start = time.perf_counter()
+        try:
+            handler(event, context)
+            error = False
+        except Exception:
+            error = True
+        return (time.perf_counter() - start) * 1000, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(invoke, events))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        'invocations': len(samples),
+        'errors': sum(1 for _, error in samples if error),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        'invocations_per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def run(requests: int, concurrency: int, tenant_count: int, latency_ms: Dict[str, float], warmup: int,
+        tenant_claims: bool = False) -> Dict[str, Any]:
+    signer = fixtures.TokenSigner()
+    tenants = fixtures.make_tenants(tenant_count)
+    latency = {service: value / 1000 for service, value in latency_ms.items()}
+
+    with StubBackend(signer.jwks(), fixtures.features_config(), tenants, latency=latency) as backend:
+        # the handlers read their configuration at import time
+        os.environ.update(fixtures.handler_env(backend.env()))
+        os.environ['TRUST_TOKEN_CLAIMS'] = str(tenant_claims).lower()
+        fixtures.add_handler_paths()
+        modules = {handler: __import__(module) for handler, module in fixtures.HANDLERS.items()}
+
+        results = {}
+        for handler, module in modules.items():
+            events = fixtures.handler_events(handler, signer, tenants, warmup + requests, with_tenant_claims=tenant_claims)
+            # the first invocations pay for the lazy imports and the first fetches
+            replay(module.lambda_handler, events[:warmup], 1)
+            backend.calls.clear()
+            results[handler] = replay(module.lambda_handler, events[warmup:], concurrency)
+            results[handler]['backend_calls'] = dict(backend.calls)
+
+    return {
+        'settings': {
+            'requests': requests,
+            'concurrency': concurrency,
+            'tenants': tenant_count,
+            'latency_ms': latency_ms,
+            'tenant_claims': tenant_claims,
+        },
+        'results': results,
+    }
+
+
+def regressions(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    found = []
+    for handler, result in current['results'].items():
+        previous = baseline['results'].get(handler)
+        if previous is None:
+            continue
+        if previous['p95_ms'] and result['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            found.append(f"{handler}: p95 {result['p95_ms']} ms, baseline {previous['p95_ms']} ms")
+        if result['invocations_per_second'] < previous['invocations_per_second'] * (1 - max_regression):
+            found.append(f"{handler}: {result['invocations_per_second']} invocations/s, baseline {previous['invocations_per_second']}")
+    return found
+
+
+def _latency_arg(value: str):
+    service, _, milliseconds = value.partition('=')
+    if service not in DEFAULT_LATENCY_MS:
+        raise argparse.ArgumentTypeError(f"unknown service {service}, expected one of {sorted(DEFAULT_LATENCY_MS)}")
+    try:
+        return service, float(milliseconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid latency {milliseconds}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmark of the backend functions")
+    parser.add_argument('--requests', type=int, default=1000, help="invocations replayed per handler")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent invocations")
+    parser.add_argument('--tenants', type=int, default=50, help="distinct tenants the events are spread over")
+    parser.add_argument('--warmup', type=int, default=5, help="invocations per handler before measuring")
+    parser.add_argument('--latency-ms', action='append', default=[], type=_latency_arg, metavar='SERVICE=MS',
+                        help=f"injected latency of one of {sorted(DEFAULT_LATENCY_MS)}, may be repeated")
+    parser.add_argument('--tenant-claims', action='store_true',
+                        help="mint tokens with the tenant claims and let the authorizer trust them")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="results of an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="tolerated p95 and throughput regression")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.concurrency, args.tenants, dict(DEFAULT_LATENCY_MS, **dict(args.latency_ms)), args.warmup,
+                 args.tenant_claims)
+
+    print(f"{'handler':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'inv/s':>10}{'errors':>8}")
+    for handler, result in report['results'].items():
+        print(f"{handler:<12}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result['invocations_per_second']:>10}{result['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(report, json.load(baseline_file), args.max_regression)
+        for regression in found:
+            print(f"Regression {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Tokens, tenants, events and environment used to run the handlers locally."""
+
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HANDLER_PATHS = [REPO_ROOT / 'backend' / name for name in ('shared', 'authorizer', 'features', 'register', 'pre_token')]
+
+# handler name -> module of its lambda_handler
+HANDLERS = {
+    'authorizer': 'authorizer',
+    'features': 'features',
+    'register': 'register',
+}
+
+REGION = 'us-east-1'
+USER_POOL_ID = 'us-east-1_bench'
+USER_POOL_CLIENT_ID = 'bench-client-id'
+METHOD_ARN = 'arn:aws:execute-api:us-east-1:123456789012:abcdef1234/prod/GET/features'
+
+
+def add_handler_paths():
+    """Puts the handler directories and the shared layer on sys.path, as Lambda does."""
+    for path in reversed(HANDLER_PATHS):
+        if str(path) not in sys.path:
+            sys.path.insert(0, str(path))
+
+
+def handler_env(stub_env: Dict[str, str]) -> Dict[str, str]:
+    return {
+        'AWS_REGION': REGION,
+        'AWS_DEFAULT_REGION': REGION,
+        'USER_POOL_ID': USER_POOL_ID,
+        'USER_POOL_CLIENT_ID': USER_POOL_CLIENT_ID,
+        'TENANT_METADATA_TABLE_NAME': 'TenantMetadata',
+        'CONFIG_APP_NAME': 'product-features',
+        'CONFIG_ENV_NAME': 'dev-env',
+        'CONFIG_PROFILE_NAME': 'features',
+        'LOG_LEVEL': 'WARNING',
+        'POWERTOOLS_SERVICE_NAME': 'benchmark',
+        **stub_env,
+    }
+
+
+def features_config() -> Dict[str, Any]:
+    sys.path.insert(0, str(REPO_ROOT))
+    try:
+        from stacks.features_config import FEATURES_CONFIG
+    finally:
+        sys.path.remove(str(REPO_ROOT))
+    return FEATURES_CONFIG
+
+
+def tenant_claims(tenant: Dict[str, Any]) -> Dict[str, str]:
+    """Claims the pre token generation trigger adds to the ID token of a tenant user."""
+    return {claim: tenant[claim] for claim in ('tenant_name', 'tenant_tier', 'fullname')}
+
+
+def make_tenants(count: int, tiers=('basic', 'premium')) -> Dict[str, Dict[str, Any]]:
+    tenants = {}
+    for index in range(count):
+        tenant_id = str(uuid.uuid4())
+        tenants[tenant_id] = {
+            'tenant_id': tenant_id,
+            'tenant_name': f'tenant-{index}',
+            'tenant_tier': tiers[index % len(tiers)],
+            'fullname': f'Bench User {index}',
+        }
+    return tenants
+
+
+class TokenSigner:
+    """RSA key pair standing in for the user pool signing key, minting ID tokens shaped
+    like the ones Cognito issues. python-jose is only imported when a signer is created."""
+
+    def __init__(self, kid: str = 'bench-key'):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.kid = kid
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode('ascii')
+        self.public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('ascii')
+
+    def jwks(self) -> Dict[str, Any]:
+        from jose import jwk
+
+        key = jwk.construct(self.public_pem, 'RS256').to_dict()
+        key.update(kid=self.kid, use='sig')
+        return {'keys': [key]}
+
+    def mint(self, tenant_id: str, expires_in: int = 3600, audience: str = USER_POOL_CLIENT_ID, **claims: Any) -> str:
+        from jose import jwt
+
+        now = int(time.time())
+        payload = {
+            'sub': str(uuid.uuid5(uuid.NAMESPACE_URL, tenant_id)),
+            'aud': audience,
+            'iss': f'https://cognito-idp.{REGION}.amazonaws.com/{USER_POOL_ID}',
+            'token_use': 'id',
+            'cognito:username': f'{tenant_id}@example.com',
+            'custom:tenant_id': tenant_id,
+            'iat': now,
+            'auth_time': now,
+            'exp': now + expires_in,
+            **claims,
+        }
+        return jwt.encode(payload, self.private_pem, algorithm='RS256', headers={'kid': self.kid})
+
+
+class LambdaContext:
+    """Minimal Lambda context object."""
+    function_name = 'benchmark'
+    aws_request_id = 'benchmark'
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def authorizer_event(token: str) -> Dict[str, Any]:
+    return {
+        'type': 'TOKEN',
+        'authorizationToken': f'Bearer {token}',
+        'methodArn': METHOD_ARN,
+    }
+
+
+def pre_token_event(tenant_id: str) -> Dict[str, Any]:
+    return {
+        'version': '1',
+        'triggerSource': 'TokenGeneration_Authentication',
+        'region': REGION,
+        'userPoolId': USER_POOL_ID,
+        'userName': f'{tenant_id}@example.com',
+        'callerContext': {'clientId': USER_POOL_CLIENT_ID},
+        'request': {
+            'userAttributes': {
+                'sub': str(uuid.uuid5(uuid.NAMESPACE_URL, tenant_id)),
+                'email': f'{tenant_id}@example.com',
+                'custom:tenant_id': tenant_id,
+            },
+            'groupConfiguration': {},
+        },
+        'response': {'claimsOverrideDetails': None},
+    }
+
+
+def features_event(tenant: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        'resource': '/features',
+        'path': '/features',
+        'httpMethod': 'GET',
+        'headers': headers or {},
+        'requestContext': {
+            'authorizer': {
+                'tenant_id': tenant['tenant_id'],
+                'tenant_name': tenant['tenant_name'],
+                'tenant_tier': tenant['tenant_tier'],
+                'fullname': tenant['fullname'],
+            }
+        },
+    }
+
+
+def register_event(index: int, tier: str = 'basic') -> Dict[str, Any]:
+    return {
+        'resource': '/register',
+        'path': '/register',
+        'httpMethod': 'POST',
+        'body': json.dumps({
+            'email': f'user-{index}-{uuid.uuid4().hex[:8]}@example.com',
+            'given_name': 'Bench',
+            'family_name': f'User {index}',
+            'tenant_name': f'tenant-{index}',
+            'tenant_tier': tier,
+        }),
+    }
+
+
+def handler_events(handler: str, signer: 'TokenSigner', tenants: Dict[str, Dict[str, Any]], count: int,
+                   with_tenant_claims: bool = False) -> List[Dict[str, Any]]:
+    """Builds `count` events for `handler`, cycling through `tenants`. With
+    `with_tenant_claims` the authorizer tokens carry the tenant claims."""
+    tenant_list = list(tenants.values())
+    events = []
+    for index in range(count):
+        tenant = tenant_list[index % len(tenant_list)]
+        if handler == 'authorizer':
+            claims = tenant_claims(tenant) if with_tenant_claims else {}
+            events.append(authorizer_event(signer.mint(tenant['tenant_id'], **claims)))
+        elif handler == 'features':
+            events.append(features_event(tenant))
+        else:
+            events.append(register_event(index, tenant['tenant_tier']))
+    return events
@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Compares the JWT verification backends of the authorizer.
+
+For each backend in backend/authorizer/verifiers.py, reports how long preparing a
+public key takes and how many tokens per second are parsed and verified. The
+`jose-legacy` row is the verification the authorizer did before the verifiers
+were introduced, decoding the token with python-jose once per header and claims
+lookup, and serves as the baseline.
+
+    python -m benchmarks.jwt_verifiers --tokens 2000
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from benchmarks import fixtures
+
+
+def _legacy_verify(token: str, public_key) -> bool:
+    from jose import jwt
+    from jose.utils import base64url_decode
+
+    jwt.get_unverified_claims(token)
+    jwt.get_unverified_headers(token)
+    message, encoded_signature = token.rsplit('.', 1)
+    if not public_key.verify(message.encode('utf8'), base64url_decode(encoded_signature.encode('utf-8'))):
+        return False
+    jwt.get_unverified_claims(token)
+    return True
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else float('inf')
+
+
+def measure(token_count: int, rounds: int) -> List[Dict[str, Any]]:
+    fixtures.add_handler_paths()
+    import verifiers
+
+    signer = fixtures.TokenSigner()
+    jwk = signer.jwks()['keys'][0]
+    tokens = [signer.mint(f'tenant-{index}') for index in range(token_count)]
+    results = []
+
+    for name in ['jose-legacy'] + sorted(verifiers.VERIFIERS):
+        verifier = verifiers.get_verifier('jose' if name == 'jose-legacy' else name)
+
+        start = time.perf_counter()
+        public_key = verifier.prepare_key(jwk)
+        prepare_ms = (time.perf_counter() - start) * 1000
+
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            if name == 'jose-legacy':
+                verified = all(_legacy_verify(token, public_key) for token in tokens)
+            else:
+                verified = all(verifier.verify(verifiers.ParsedToken(token), public_key) for token in tokens)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if not verified:
+            raise RuntimeError(f'{name} rejected a valid token')
+
+        results.append({
+            'backend': name,
+            'prepare_key_ms': round(prepare_ms, 3),
+            'verifications_per_second': _rate(token_count, best),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JWT verification backends")
+    parser.add_argument('--tokens', type=int, default=2000, help="distinct tokens verified per round")
+    parser.add_argument('--rounds', type=int, default=3, help="rounds per backend, the fastest one is reported")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = measure(args.tokens, args.rounds)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    baseline = results[0]['verifications_per_second']
+    print(f"{'backend':<14}{'prepare ms':>12}{'verify/s':>12}{'speedup':>10}")
+    for result in results:
+        speedup = result['verifications_per_second'] / baseline
+        print(f"{result['backend']:<14}{result['prepare_key_ms']:>12}{result['verifications_per_second']:>12}{speedup:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Measures the cold start of the backend functions.
+
+Every run starts a fresh interpreter per function, the way Lambda starts a new
+execution environment, and reports the time to import the handler module (the INIT
+phase), the first invocation and a second, warm invocation. Each function is
+measured with lazy initialization and with PREWARM_ON_INIT=true, against the local
+stubs in benchmarks/stubs.py.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --json --max-cold-ms 1500
+
+With --max-cold-ms the command exits with status 1 when the median INIT plus first
+invocation time of any function and mode exceeds the threshold, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks import fixtures
+from benchmarks.stubs import StubBackend
+
+MODES = {
+    'lazy': {'PREWARM_ON_INIT': 'false'},
+    'prewarm': {'PREWARM_ON_INIT': 'true'},
+}
+
+
+def _child(handler: str, spec_path: str):
+    with open(spec_path) as spec_file:
+        spec = json.load(spec_file)
+    fixtures.add_handler_paths()
+
+    start = time.perf_counter()
+    module = __import__(fixtures.HANDLERS[handler])
+    init_ms = (time.perf_counter() - start) * 1000
+
+    timings = {'init_ms': init_ms}
+    for name, event in zip(('first_ms', 'second_ms'), spec['events'][handler]):
+        start = time.perf_counter()
+        try:
+            module.lambda_handler(event, fixtures.LambdaContext())
+        except Exception as e:
+            # the authorizer reports a denied request by raising
+            timings['error'] = repr(e)
+        timings[name] = (time.perf_counter() - start) * 1000
+    print(json.dumps(timings))
+
+
+def _run_child(handler: str, spec_path: str, env: Dict[str, str]) -> Dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child', handler, '--spec', spec_path],
+        cwd=str(fixtures.REPO_ROOT), env=env, capture_output=True, text=True, check=True
+    )
+    # the handler may log to stdout, the timings are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int) -> List[Dict[str, Any]]:
+    signer = fixtures.TokenSigner()
+    tenants = fixtures.make_tenants(2)
+    results = []
+
+    with StubBackend(signer.jwks(), fixtures.features_config(), tenants) as backend, \
+            tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as spec_file:
+        spec = {'events': {handler: fixtures.handler_events(handler, signer, tenants, 2) for handler in fixtures.HANDLERS}}
+        json.dump(spec, spec_file)
+        spec_file.close()
+
+        base_env = dict(os.environ, **fixtures.handler_env(backend.env()))
+        try:
+            for handler in fixtures.HANDLERS:
+                for mode, mode_env in MODES.items():
+                    samples = [_run_child(handler, spec_file.name, dict(base_env, **mode_env)) for _ in range(runs)]
+                    result = {'handler': handler, 'mode': mode, 'runs': runs}
+                    for key in ('init_ms', 'first_ms', 'second_ms'):
+                        result[key] = round(statistics.median(sample[key] for sample in samples), 2)
+                    result['cold_ms'] = round(statistics.median(sample['init_ms'] + sample['first_ms'] for sample in samples), 2)
+                    errors = [sample['error'] for sample in samples if 'error' in sample]
+                    if errors:
+                        result['error'] = errors[0]
+                    results.append(result)
+        finally:
+            os.unlink(spec_file.name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of the backend functions")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per function and mode")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    parser.add_argument('--max-cold-ms', type=float, help="fail when a median INIT + first invocation exceeds this")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--spec', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.spec)
+        return
+
+    results = measure(args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'handler':<12}{'mode':<10}{'init ms':>10}{'first ms':>10}{'second ms':>11}{'cold ms':>10}")
+        for result in results:
+            print(f"{result['handler']:<12}{result['mode']:<10}{result['init_ms']:>10}{result['first_ms']:>10}{result['second_ms']:>11}{result['cold_ms']:>10}"
+                  + (f"  ({result['error']})" if 'error' in result else ''))
+
+    if args.max_cold_ms is not None:
+        slow = [result for result in results if result['cold_ms'] > args.max_cold_ms]
+        for result in slow:
+            print(f"{result['handler']} ({result['mode']}) cold start {result['cold_ms']} ms exceeds {args.max_cold_ms} ms", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Local stand-ins for the services the backend functions call.
+
+One HTTP server plays the Cognito JWKS endpoint, the AppConfig Lambda extension and
+the DynamoDB and Cognito APIs (JSON protocol), so the handlers run unmodified with
+only their endpoints pointed at it. Uses the standard library only.
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+JWKS_PATH = '/.well-known/jwks.json'
+# partition keys of the tenant metadata and registration status tables
+KEY_ATTRIBUTES = ('tenant_id', 'tracking_id')
+
+
+def to_dynamodb_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: {'N': str(value)} if isinstance(value, (int, float)) else {'S': str(value)} for key, value in item.items()}
+
+
+class StubBackend:
+    """Serves `jwks`, the feature flags `config` and the `tenants` items (tenant_id ->
+    item) on 127.0.0.1. `calls` counts the requests received per operation.
+
+    `latency` maps a service ('jwks', 'appconfig', 'dynamodb' or 'cognito') to the
+    seconds each of its responses is delayed, to approximate the network and service
+    time of the real endpoints. `port` defaults to a free port, the AppConfig
+    extension listens on 2772."""
+
+    def __init__(self, jwks: Dict[str, Any], config: Dict[str, Any], tenants: Optional[Dict[str, Dict[str, Any]]] = None,
+                 config_version: str = '1', latency: Optional[Dict[str, float]] = None, port: int = 0):
+        self.jwks = jwks
+        self.config = config
+        self.config_version = config_version
+        self.items = {tenant_id: to_dynamodb_item(item) for tenant_id, item in (tenants or {}).items()}
+        self.users: Dict[str, Any] = {}
+        self.calls = Counter()
+        self.latency = dict(latency or {})
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self) -> 'StubBackend':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def set_config(self, config: Dict[str, Any], config_version: str):
+        with self._lock:
+            self.config = config
+            self.config_version = config_version
+
+    def delay(self, service: str):
+        seconds = self.latency.get(service)
+        if seconds:
+            time.sleep(seconds)
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables pointing the backend functions at this server."""
+        return {
+            'JWKS_URL': self.url + JWKS_PATH,
+            'AWS_APPCONFIG_EXTENSION_HTTP_PORT': str(self.port),
+            # boto3 1.28+ sends every AWS API call here
+            'AWS_ENDPOINT_URL': self.url,
+            'AWS_ACCESS_KEY_ID': 'stub',
+            'AWS_SECRET_ACCESS_KEY': 'stub',
+        }
+
+    # AWS JSON protocol operations, return (status, body)
+
+    @staticmethod
+    def _key(item):
+        return next(item[name]['S'] for name in KEY_ATTRIBUTES if name in item)
+
+    def dynamodb_get_item(self, request):
+        item = self.items.get(self._key(request['Key']))
+        return 200, {'Item': item} if item is not None else {}
+
+    def dynamodb_put_item(self, request):
+        item = request['Item']
+        key = self._key(item)
+        with self._lock:
+            if 'attribute_not_exists' in request.get('ConditionExpression', '') and key in self.items:
+                return 400, {'__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException', 'message': 'The conditional request failed'}
+            self.items[key] = item
+        return 200, {}
+
+    def dynamodb_batch_write_item(self, request):
+        with self._lock:
+            for writes in request['RequestItems'].values():
+                for write in writes:
+                    item = write['PutRequest']['Item']
+                    self.items[self._key(item)] = item
+        return 200, {'UnprocessedItems': {}}
+
+    def cognito_admin_create_user(self, request):
+        username = request['Username']
+        with self._lock:
+            if username in self.users:
+                return 400, {'__type': 'UsernameExistsException', 'message': 'User account already exists'}
+            self.users[username] = request['UserAttributes']
+        return 200, {'User': {'Username': username, 'Attributes': request['UserAttributes'], 'Enabled': True, 'UserStatus': 'FORCE_CHANGE_PASSWORD'}}
+
+    def cognito_admin_delete_user(self, request):
+        with self._lock:
+            self.users.pop(request['Username'], None)
+        return 200, {}
+
+
+OPERATIONS = {
+    'DynamoDB_20120810.GetItem': 'dynamodb_get_item',
+    'DynamoDB_20120810.PutItem': 'dynamodb_put_item',
+    'DynamoDB_20120810.BatchWriteItem': 'dynamodb_batch_write_item',
+    'AWSCognitoIdentityProviderService.AdminCreateUser': 'cognito_admin_create_user',
+    'AWSCognitoIdentityProviderService.AdminDeleteUser': 'cognito_admin_delete_user',
+}
+
+
+def _make_handler(backend: StubBackend):
+
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, like the real endpoints
+        protocol_version = 'HTTP/1.1'
+        # headers and body are buffered and sent in one write once the request is
+        # handled, and TCP_NODELAY is set: with separate writes on a kept-alive
+        # connection, Nagle's algorithm and delayed ACKs add about 40 ms per response
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == JWKS_PATH:
+                backend.calls['jwks'] += 1
+                backend.delay('jwks')
+                self._reply(200, backend.jwks)
+            elif self.path.startswith('/applications/'):
+                backend.calls['appconfig'] += 1
+                backend.delay('appconfig')
+                self._reply(200, backend.config, {'Configuration-Version': backend.config_version})
+            else:
+                self._reply(404, {'message': 'Not found'})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            target = self.headers.get('X-Amz-Target', '')
+            operation = OPERATIONS.get(target)
+            if operation is None:
+                self._reply(400, {'__type': 'UnknownOperationException', 'message': target})
+                return
+            backend.calls[target.split('.')[-1]] += 1
+            backend.delay('dynamodb' if target.startswith('DynamoDB') else 'cognito')
+            status, body = getattr(backend, operation)(request)
+            self._reply(status, body)
+
+        def _reply(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/x-amz-json-1.0' if self.command == 'POST' else 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
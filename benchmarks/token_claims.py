@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Checks and measures the tenant claims path of the authorizer.
+
+For every tenant the pre token generation trigger is run against the local stubs in
+benchmarks/stubs.py, and the claims it returns are added to a token signed by the
+local key, the way Cognito issues ID tokens once the trigger is deployed. A second
+token without the claims stands for a token issued before. The authorizer, imported
+with TRUST_TOKEN_CLAIMS=true and without a tenant cache, is invoked with both.
+
+    python -m benchmarks.token_claims --tenants 200 --latency-ms 5
+
+The command exits with status 1 when the trigger returns claims that differ from
+the tenant metadata, when both tokens of a tenant do not produce the same authorizer
+context, or when a token with the claims caused a DynamoDB call.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks import fixtures
+from benchmarks.e2e import percentile
+from benchmarks.stubs import StubBackend
+
+GET_ITEM = 'GetItem'
+
+
+def _invoke(authorizer, tokens: List[str]):
+    context = fixtures.LambdaContext()
+    latencies, contexts = [], []
+    for token in tokens:
+        start = time.perf_counter()
+        response = authorizer.lambda_handler(fixtures.authorizer_event(token), context)
+        latencies.append((time.perf_counter() - start) * 1000)
+        contexts.append(response['context'])
+    return sorted(latencies), contexts
+
+
+def run(tenant_count: int, dynamodb_latency_ms: float) -> Dict[str, Any]:
+    signer = fixtures.TokenSigner()
+    tenants = fixtures.make_tenants(tenant_count)
+    errors = []
+
+    with StubBackend(signer.jwks(), fixtures.features_config(), tenants, latency={'dynamodb': dynamodb_latency_ms / 1000}) as backend:
+        os.environ.update(fixtures.handler_env(backend.env()))
+        # every token without the claims pays for the tenant lookup
+        os.environ.update(TRUST_TOKEN_CLAIMS='true', TENANT_CACHE_TTL='0', NEGATIVE_TENANT_CACHE_TTL='0')
+        fixtures.add_handler_paths()
+        import authorizer
+        import pre_token
+
+        with_claims, without_claims = [], []
+        for tenant_id, tenant in tenants.items():
+            event = pre_token.lambda_handler(fixtures.pre_token_event(tenant_id), fixtures.LambdaContext())
+            claims = (event['response']['claimsOverrideDetails'] or {}).get('claimsToAddOrOverride', {})
+            if claims != fixtures.tenant_claims(tenant):
+                errors.append(f"tenant {tenant_id}: trigger returned claims {claims}")
+            with_claims.append(signer.mint(tenant_id, **claims))
+            without_claims.append(signer.mint(tenant_id))
+
+        # fetches the key set before measuring
+        _invoke(authorizer, [signer.mint(next(iter(tenants)))])
+
+        results = {}
+        contexts = {}
+        for kind, tokens in (('with_claims', with_claims), ('without_claims', without_claims)):
+            backend.calls.clear()
+            latencies, contexts[kind] = _invoke(authorizer, tokens)
+            results[kind] = {
+                'invocations': len(tokens),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'mean_ms': round(statistics.fmean(latencies), 3),
+                'dynamodb_calls': backend.calls[GET_ITEM],
+            }
+
+    for tenant_id, with_context, without_context in zip(tenants, contexts['with_claims'], contexts['without_claims']):
+        if with_context != without_context:
+            errors.append(f"tenant {tenant_id}: context {with_context} with claims, {without_context} without")
+    if results['with_claims']['dynamodb_calls']:
+        errors.append(f"tokens with claims made {results['with_claims']['dynamodb_calls']} DynamoDB calls")
+    return {'results': results, 'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and measure the tenant claims path of the authorizer")
+    parser.add_argument('--tenants', type=int, default=100, help="tenants, one token of each kind per tenant")
+    parser.add_argument('--latency-ms', type=float, default=4.0, help="injected DynamoDB latency")
+    args = parser.parse_args()
+
+    report = run(args.tenants, args.latency_ms)
+
+    print(f"{'tokens':<16}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'DynamoDB':>10}")
+    for kind, result in report['results'].items():
+        print(f"{kind:<16}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['mean_ms']:>10}{result['dynamodb_calls']:>10}")
+
+    for error in report['errors']:
+        print(f"Error {error}", file=sys.stderr)
+    if report['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
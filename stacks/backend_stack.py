@@ -1,13 +1,23 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import base64
+import hashlib
+import json
+from typing import List
+
+import jsii
 from aws_cdk import (
+    Annotations,
     Stack,
     CfnOutput,
+    Duration,
     RemovalPolicy,
     aws_lambda as _lambda,
     aws_lambda_python_alpha as pylambda,
+    aws_lambda_event_sources as event_sources,
     aws_iam as iam,
+    aws_sqs as sqs,
     aws_apigateway as apigateway
 )
 from constructs import Construct
@@ -15,6 +25,9 @@ from constructs import Construct
 from stacks.data_stack import DataStack
 from stacks.identity_stack import IdentityStack
 from stacks.config_stack import ConfigStack
+from stacks.features_config import FEATURES_CONFIG, RATE_LIMITS_CONFIG
+from stacks.layers import powertools_layer, shared_layer
+from stacks.performance_profiles import ProfileValidation, get_profile
 
 # Constants for layer ARNs
 APPCONFIG_EXT_ARN = {
@@ -24,13 +37,59 @@ APPCONFIG_EXT_ARN = {
     'us-west-2': 'arn:aws:lambda:us-west-2:359756378197:layer:AWS-AppConfig-Extension:146',
     # Additional regions. See here: https://docs.aws.amazon.com/appconfig/latest/userguide/appconfig-integration-lambda-extensions-versions.html#appconfig-integration-lambda-extensions-enabling-x86-64
 }
-POWERTOOLS_ARN = 'arn:aws:lambda:{}:017000801446:layer:AWSLambdaPowertoolsPythonV2:20'
+
+CONFIG_STORES = ("appconfig", "snapshot", "layered")
+
+
+@jsii.implements(pylambda.ICommandHooks)
+class BundledSnapshot:
+    """Bundling hooks writing the configuration snapshot read by backend/features/snapshot_store.py
+    to the bundled features function, in the format of snapshot_store.write_snapshot. The version
+    marker is a hash of the content."""
+
+    FILE_NAME = "config.snapshot"
+
+    def __init__(self, config: dict):
+        # features and rules keep their order, which decides the rule that matches first
+        content = json.dumps(config, separators=(",", ":"))
+        version = "bundled-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        self.snapshot = json.dumps({"version": version}) + "\n" + content
+
+    def before_bundling(self, input_dir: str, output_dir: str) -> List[str]:
+        return []
+
+    def after_bundling(self, input_dir: str, output_dir: str) -> List[str]:
+        # base64 needs no quoting in the shell of the bundling container
+        encoded = base64.b64encode(self.snapshot.encode("utf-8")).decode("ascii")
+        return [f"echo {encoded} | base64 -d > {output_dir}/{self.FILE_NAME}"]
+
+
+def _usage_plan_key(stack_name: str, tier: str) -> str:
+    # the value is not a secret, the API only takes usage plan keys from the authorizer
+    return hashlib.sha256(f"{stack_name}/{tier}".encode("utf-8")).hexdigest()
 
 
 class BackendStack(Stack):
     def __init__(self, scope: Construct, id: str, data_stack: DataStack, identity_stack: IdentityStack, config_stack: ConfigStack, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
+
+        # cdk deploy -c performance_profile=standard, see stacks/performance_profiles.py
+        self.profile = get_profile(self.node.try_get_context("performance_profile"))
+        architecture = _lambda.Architecture.ARM_64 if self.profile.architecture == "arm64" else _lambda.Architecture.X86_64
         
+        # cdk deploy -c tenant_rate_limits=true enforces the per tenant limits in the authorizer, which
+        # then runs for every request: its responses are not cached by API Gateway
+        self.tenant_rate_limits = str(self.node.try_get_context("tenant_rate_limits") or "false").lower() == "true"
+        # cdk deploy -c shared_rate_limits=true to count the requests of a tenant across execution environments
+        shared_rate_limits = str(self.node.try_get_context("shared_rate_limits") or "false").lower() == "true"
+        self.authorizer_cache_ttl = 0 if self.tenant_rate_limits else self.profile.authorizer_cache_ttl
+        # cdk deploy -c config_store=layered to fall back to the configuration snapshot bundled with the
+        # features function when the AppConfig agent is unavailable, or config_store=snapshot to only read
+        # the snapshot, without the AppConfig extension: configuration changes then need a deployment
+        self.config_store = str(self.node.try_get_context("config_store") or "appconfig").lower()
+        if self.config_store not in CONFIG_STORES:
+            raise ValueError("config_store must be one of {}".format(", ".join(CONFIG_STORES)))
+
         # Environment Variables
         self.env_vars = {
             "TENANT_METADATA_TABLE_NAME": data_stack.table_name,
@@ -38,7 +97,17 @@ class BackendStack(Stack):
             "USER_POOL_CLIENT_ID": identity_stack.user_pool_client_id,
             "CONFIG_APP_NAME": config_stack.config_app_name,
             "CONFIG_ENV_NAME": config_stack.config_env_name,
-            "CONFIG_PROFILE_NAME": config_stack.config_profile_name
+            "CONFIG_PROFILE_NAME": config_stack.config_profile_name,
+            # cdk deploy -c prewarm_on_init=true to load keys, configuration and clients during INIT
+            "PREWARM_ON_INIT": str(self.node.try_get_context("prewarm_on_init") or "false").lower(),
+            # cdk deploy -c metrics_high_resolution=true to publish 1 second latency metrics
+            "METRICS_HIGH_RESOLUTION": str(self.node.try_get_context("metrics_high_resolution") or "false").lower(),
+            # cdk deploy -c log_sample_rates=INFO=0.05 -c log_debug_tenants=<tenant id>,...
+            "LOG_SAMPLE_RATES": self.node.try_get_context("log_sample_rates") or "",
+            "LOG_DEBUG_TENANTS": self.node.try_get_context("log_debug_tenants") or "",
+            # cdk deploy -c trust_token_claims=true for the authorizer to take the tenant claims added by the
+            # pre token generation trigger instead of the tenant metadata, tier changes then wait for a token refresh
+            "TRUST_TOKEN_CLAIMS": str(self.node.try_get_context("trust_token_claims") or "false").lower()
         }
 
         # AWS Lambda roles
@@ -48,14 +117,31 @@ class BackendStack(Stack):
         )
         self.authorizer_role.apply_removal_policy(RemovalPolicy.DESTROY)
         data_stack.table_obj.grant(self.authorizer_role, "dynamodb:GetItem")
+        if self.tenant_rate_limits:
+            self.authorizer_role.add_to_policy(iam.PolicyStatement(
+                actions=["appconfig:GetLatestConfiguration", "appconfig:StartConfigurationSession"],
+                resources=['arn:aws:appconfig:{}:{}:*'.format(self.region, self.account)]
+            ))
+        if self.tenant_rate_limits and shared_rate_limits:
+            data_stack.rate_limit_table_obj.grant(self.authorizer_role, "dynamodb:UpdateItem")
 
         self.register_role = iam.Role(self, "RegisterLambdaRole",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
             managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]    
         )
         self.register_role.apply_removal_policy(RemovalPolicy.DESTROY)
-        data_stack.table_obj.grant(self.register_role, "dynamodb:Query", "dynamodb:PutItem")
-        identity_stack.user_pool_obj.grant(self.register_role, "cognito-idp:AdminCreateUser")
+        data_stack.table_obj.grant(self.register_role, "dynamodb:Query", "dynamodb:PutItem", "dynamodb:BatchWriteItem")
+        data_stack.status_table_obj.grant(self.register_role, "dynamodb:GetItem", "dynamodb:PutItem")
+        identity_stack.user_pool_obj.grant(self.register_role, "cognito-idp:AdminCreateUser", "cognito-idp:AdminDeleteUser", "cognito-idp:AdminGetUser")
+
+        self.register_worker_role = iam.Role(self, "RegisterWorkerLambdaRole",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]
+        )
+        self.register_worker_role.apply_removal_policy(RemovalPolicy.DESTROY)
+        data_stack.table_obj.grant(self.register_worker_role, "dynamodb:PutItem")
+        data_stack.status_table_obj.grant(self.register_worker_role, "dynamodb:GetItem", "dynamodb:PutItem")
+        identity_stack.user_pool_obj.grant(self.register_worker_role, "cognito-idp:AdminCreateUser", "cognito-idp:AdminGetUser", "cognito-idp:AdminDeleteUser")
 
         self.features_role = iam.Role(self, "FeaturesLambdaRole",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
@@ -70,11 +156,43 @@ class BackendStack(Stack):
         self.features_role.apply_removal_policy(RemovalPolicy.DESTROY)
 
         # Lambda Layers
-        powertools = _lambda.LayerVersion.from_layer_version_arn(self, "PowerTools", POWERTOOLS_ARN.format(self.region))
-        try:
-            appconfig_extention = _lambda.LayerVersion.from_layer_version_arn(self, "AppConfigExtention", APPCONFIG_EXT_ARN[self.region])
-        except KeyError:
-            raise ValueError("No ARN defined for region {}".format(self.region))
+        powertools = powertools_layer(self, self.region)
+        if self.config_store == "snapshot":
+            self.features_architecture = architecture
+            appconfig_extention = None
+        else:
+            # the AppConfig extension ships a native agent, its arm64 build is a separate layer
+            appconfig_extension_arm64_arn = self.node.try_get_context("appconfig_extension_arm64_arn")
+            if architecture == _lambda.Architecture.ARM_64 and appconfig_extension_arm64_arn:
+                self.features_architecture = _lambda.Architecture.ARM_64
+                appconfig_extention = _lambda.LayerVersion.from_layer_version_arn(self, "AppConfigExtention", appconfig_extension_arm64_arn)
+            else:
+                if architecture == _lambda.Architecture.ARM_64:
+                    Annotations.of(self).add_warning(
+                        "Features function deployed on x86_64: set the appconfig_extension_arm64_arn context to the "
+                        "arm64 AppConfig extension layer of the region to run it on arm64"
+                    )
+                self.features_architecture = _lambda.Architecture.X86_64
+                try:
+                    appconfig_extention = _lambda.LayerVersion.from_layer_version_arn(self, "AppConfigExtention", APPCONFIG_EXT_ARN[self.region])
+                except KeyError:
+                    raise ValueError("No ARN defined for region {}".format(self.region))
+
+        self.shared_layer = shared_layer(self)
+
+        # API key of the usage plan of each tier, returned by the authorizer for the tenants of the tier,
+        # the usage plans are only deployed with the tenant rate limits
+        self.usage_plan_keys = {tier: _usage_plan_key(self.stack_name, tier) for tier in RATE_LIMITS_CONFIG["tier_limits"]}
+        self.authorizer_env_vars = {
+            **self.env_vars,
+            "RATE_LIMITS_ENABLED": str(self.tenant_rate_limits).lower(),
+            "RATE_LIMITS_PROFILE_NAME": config_stack.rate_limits_profile_name,
+            "RATE_LIMIT_TABLE_NAME": data_stack.rate_limit_table_name if self.tenant_rate_limits and shared_rate_limits else "",
+            "USAGE_PLAN_KEYS": json.dumps({
+                **self.usage_plan_keys,
+                "default": self.usage_plan_keys[RATE_LIMITS_CONFIG["default_tier"]]
+            }) if self.tenant_rate_limits else ""
+        }
 
         # Authorizer Lambda
         self.authorizer_lambda = pylambda.PythonFunction(self, "AuthorizerLambda",
@@ -83,10 +201,29 @@ class BackendStack(Stack):
             entry="backend/authorizer",
             index="authorizer.py",
             handler="lambda_handler",
-            layers=[powertools],
-            environment=self.env_vars
+            layers=[powertools, self.shared_layer],
+            environment=self.authorizer_env_vars,
+            memory_size=self.profile.authorizer_memory_size,
+            architecture=architecture
         )
         self.authorizer_lambda.apply_removal_policy(RemovalPolicy.DESTROY)
+        # API Gateway invokes the alias, which holds the provisioned concurrency
+        self.authorizer_alias = _lambda.Alias(self, "AuthorizerAlias",
+            alias_name="live",
+            version=self.authorizer_lambda.current_version,
+            provisioned_concurrent_executions=self.profile.authorizer_provisioned_concurrency or None
+        )
+
+        # cdk deploy -c features_cache_control_by_tier='{"basic": "private, max-age=300"}'
+        cache_control_by_tier = self.node.try_get_context("features_cache_control_by_tier") or {}
+        self.features_env_vars = {
+            **self.env_vars,
+            "FEATURES_CACHE_CONTROL_BY_TIER": cache_control_by_tier if isinstance(cache_control_by_tier, str) else json.dumps(cache_control_by_tier),
+            "CONFIG_STORE": self.config_store
+        }
+        features_bundling = None
+        if self.config_store != "appconfig":
+            features_bundling = pylambda.BundlingOptions(command_hooks=BundledSnapshot(FEATURES_CONFIG))
 
         # Features Lambda
         self.features_lambda = pylambda.PythonFunction(self, "FeaturesLambda",
@@ -95,13 +232,43 @@ class BackendStack(Stack):
             entry="backend/features",
             index="features.py",
             handler="lambda_handler",
-            layers=[
+            bundling=features_bundling,
+            layers=[layer for layer in (
                 powertools,
-                appconfig_extention
-            ],
-            environment=self.env_vars
+                appconfig_extention,
+                self.shared_layer
+            ) if layer is not None],
+            environment=self.features_env_vars,
+            memory_size=self.profile.features_memory_size,
+            architecture=self.features_architecture
         )
         self.features_lambda.apply_removal_policy(RemovalPolicy.DESTROY)
+        self.features_alias = _lambda.Alias(self, "FeaturesAlias",
+            alias_name="live",
+            version=self.features_lambda.current_version,
+            provisioned_concurrent_executions=self.profile.features_provisioned_concurrency or None
+        )
+
+        # Queue of asynchronous registrations, drained by the register worker
+        self.registration_dlq = sqs.Queue(self, "RegistrationDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        self.registration_dlq.apply_removal_policy(RemovalPolicy.DESTROY)
+        self.registration_queue = sqs.Queue(self, "RegistrationQueue",
+            # at least six times the worker timeout, as recommended for SQS event sources
+            visibility_timeout=Duration.minutes(6),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=self.registration_dlq)
+        )
+        self.registration_queue.apply_removal_policy(RemovalPolicy.DESTROY)
+        self.registration_queue.grant_send_messages(self.register_role)
+
+        self.registration_env_vars = {
+            **self.env_vars,
+            "REGISTRATION_QUEUE_URL": self.registration_queue.queue_url,
+            "REGISTRATION_STATUS_TABLE_NAME": data_stack.status_table_name,
+            # cdk deploy -c async_registration=true to return 202 and register in the worker
+            "ASYNC_REGISTRATION": str(self.node.try_get_context("async_registration") or "false").lower()
+        }
 
         # Register Lambda
         self.register_lambda = pylambda.PythonFunction(self, "RegisterLambda",
@@ -110,11 +277,36 @@ class BackendStack(Stack):
             entry="backend/register",
             index="register.py",
             handler="lambda_handler",
-            layers=[powertools],
-            environment=self.env_vars
+            layers=[powertools, self.shared_layer],
+            environment=self.registration_env_vars,
+            memory_size=self.profile.register_memory_size,
+            architecture=architecture,
+            # bulk registrations are invoked directly and can run for several minutes,
+            # requests through API Gateway are still limited by its integration timeout
+            timeout=Duration.minutes(15)
         )
         self.register_lambda.apply_removal_policy(RemovalPolicy.DESTROY)
 
+        # Register Worker Lambda
+        self.register_worker_lambda = pylambda.PythonFunction(self, "RegisterWorkerLambda",
+            role=self.register_worker_role,
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            entry="backend/register",
+            index="worker.py",
+            handler="lambda_handler",
+            layers=[powertools, self.shared_layer],
+            environment=self.registration_env_vars,
+            memory_size=self.profile.register_memory_size,
+            architecture=architecture,
+            timeout=Duration.minutes(1)
+        )
+        self.register_worker_lambda.apply_removal_policy(RemovalPolicy.DESTROY)
+        self.register_worker_lambda.add_event_source(event_sources.SqsEventSource(self.registration_queue,
+            batch_size=10,
+            max_batching_window=Duration.seconds(1),
+            report_batch_item_failures=True
+        ))
+
         # API Gateway Setup
         self.api = apigateway.RestApi(self, "BackendApi",
             endpoint_configuration=apigateway.EndpointConfiguration(
@@ -123,23 +315,63 @@ class BackendStack(Stack):
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=apigateway.Cors.ALL_ORIGINS,
                 allow_methods=apigateway.Cors.ALL_METHODS,
-                allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin", "Accept"]
-                )
+                allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin", "Accept", "If-None-Match"]
+                ),
+            # usage plans are selected by the key the authorizer returns, never by a client header
+            api_key_source_type=apigateway.ApiKeySourceType.AUTHORIZER if self.tenant_rate_limits else None,
+            deploy_options=apigateway.StageOptions(
+                throttling_rate_limit=self.profile.throttling_rate_limit,
+                throttling_burst_limit=self.profile.throttling_burst_limit
+            )
             )
         self.api.apply_removal_policy(RemovalPolicy.DESTROY)
 
-        self.authorizer = apigateway.TokenAuthorizer(self, "ApiAuthorizer", handler=self.authorizer_lambda)
+        self.authorizer = apigateway.TokenAuthorizer(self, "ApiAuthorizer",
+            handler=self.authorizer_alias,
+            results_cache_ttl=Duration.seconds(self.authorizer_cache_ttl)
+        )
         self.authorizer.apply_removal_policy(RemovalPolicy.DESTROY)
 
         self.features_resource = self.api.root.add_resource("features")
         self.features_resource.add_method("GET",
-            integration=apigateway.LambdaIntegration(handler=self.features_lambda),
-            authorizer=self.authorizer
+            integration=apigateway.LambdaIntegration(handler=self.features_alias),
+            authorizer=self.authorizer,
+            api_key_required=self.tenant_rate_limits
         )
         self.register_resource = self.api.root.add_resource("register")
         self.register_resource.add_method("POST",
             integration=apigateway.LambdaIntegration(handler=self.register_lambda)
         )
+        self.register_status_resource = self.register_resource.add_resource("{tracking_id}")
+        self.register_status_resource.add_method("GET",
+            integration=apigateway.LambdaIntegration(handler=self.register_lambda)
+        )
+
+        if self.tenant_rate_limits:
+            # Usage plan per tier, limiting the requests of all the tenants of the tier together
+            for tier, limits in RATE_LIMITS_CONFIG["tier_limits"].items():
+                usage_plan = self.api.add_usage_plan(f"{tier.capitalize()}UsagePlan",
+                    name=f"{self.stack_name}-{tier}",
+                    throttle=apigateway.ThrottleSettings(rate_limit=limits["rate"], burst_limit=limits["burst"]),
+                    api_stages=[apigateway.UsagePlanPerApiStage(api=self.api, stage=self.api.deployment_stage)]
+                )
+                usage_plan.add_api_key(apigateway.ApiKey(self, f"{tier.capitalize()}UsagePlanKey",
+                    value=self.usage_plan_keys[tier]
+                ))
+
+            # the authorizer only denies requests of tenants over their limit
+            self.api.add_gateway_response("ThrottledResponse",
+                type=apigateway.ResponseType.ACCESS_DENIED,
+                status_code="429",
+                response_headers={
+                    "Access-Control-Allow-Origin": "'*'",
+                    "Retry-After": "'1'"
+                },
+                templates={"application/json": '{"message": "Too Many Requests"}'}
+            )
+
+        # fails the synth if the resources do not carry the settings of the profile
+        self.node.add_validation(ProfileValidation(self, self.profile))
 
         # Output the BackendApi CloudFormation outputs for easier reference
         CfnOutput(self, "BackendApiURL", value=self.api.url, description="Backend Api URL")
@@ -10,41 +10,13 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from stacks.features_config import FEATURES_CONFIG, RATE_LIMITS_CONFIG
+
 class ConfigStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
         # AWS AppConfig setup
-        features_config = {
-            "analytics": {
-                "default": False,
-                "rules": {
-                    "customer tier equals basic or premium": {
-                        "when_match": True,
-                        "conditions": [{"action": "KEY_IN_VALUE", "key": "tier", "value": ["basic", "premium"]}],
-                    }
-                },
-            },
-            "crm": {
-                "default": False,
-                "rules": {
-                    "customer tier equals basic or premium": {
-                        "when_match": True,
-                        "conditions": [{"action": "KEY_IN_VALUE", "key": "tier", "value": ["basic", "premium"]}],
-                    }
-                },
-            },
-            "email": {
-                "default": False,
-                "rules": {
-                    "customer tier equals premium": {
-                        "when_match": True,
-                        "conditions": [{"action": "EQUALS", "key": "tier", "value": "premium"}],
-                    }
-                },
-            }
-        }
-
         self.config_app = appconfig.CfnApplication(
             self,
             id="app",
@@ -74,7 +46,7 @@ class ConfigStack(Stack):
             "version",
             application_id=self.config_app.ref,
             configuration_profile_id=self.config_profile.ref,
-            content=json.dumps(features_config),
+            content=json.dumps(FEATURES_CONFIG),
             content_type="application/json",
         )
         self.hosted_cfg_version.apply_removal_policy(RemovalPolicy.DESTROY)
@@ -90,6 +62,39 @@ class ConfigStack(Stack):
         )
         self.app_config_deployment.apply_removal_policy(RemovalPolicy.DESTROY)
 
+        # Request rate limits of each tier, read by the authorizer
+        self.rate_limits_profile = appconfig.CfnConfigurationProfile(
+            self,
+            id="rate-limits-profile",
+            application_id=self.config_app.ref,
+            location_uri="hosted",
+            name="rate-limits",
+        )
+        self.rate_limits_profile.apply_removal_policy(RemovalPolicy.DESTROY)
+
+        self.rate_limits_version = appconfig.CfnHostedConfigurationVersion(
+            self,
+            "rate-limits-version",
+            application_id=self.config_app.ref,
+            configuration_profile_id=self.rate_limits_profile.ref,
+            content=json.dumps(RATE_LIMITS_CONFIG),
+            content_type="application/json",
+        )
+        self.rate_limits_version.apply_removal_policy(RemovalPolicy.DESTROY)
+
+        self.rate_limits_deployment = appconfig.CfnDeployment(
+            self,
+            id="rate-limits-deploy",
+            application_id=self.config_app.ref,
+            configuration_profile_id=self.rate_limits_profile.ref,
+            configuration_version=self.rate_limits_version.ref,
+            deployment_strategy_id="AppConfig.AllAtOnce",
+            environment_id=self.config_env.ref,
+        )
+        self.rate_limits_deployment.apply_removal_policy(RemovalPolicy.DESTROY)
+        # deployments to the same environment are started one after the other
+        self.rate_limits_deployment.add_dependency(self.app_config_deployment)
+
     @property
     def config_app_name(self) -> str:
         return self.config_app.name
@@ -101,3 +106,7 @@ class ConfigStack(Stack):
     @property
     def config_profile_name(self) -> str:
         return self.config_profile.name
+
+    @property
+    def rate_limits_profile_name(self) -> str:
+        return self.rate_limits_profile.name
@@ -8,6 +8,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+TENANT_TIER_INDEX_NAME = "TenantTierIndex"
+
 class DataStack(Stack):
 
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
@@ -23,6 +25,44 @@ class DataStack(Stack):
             removal_policy=RemovalPolicy.DESTROY
         )
 
+        # Index the tenants by tier, so reports and tier migrations query one tier
+        # instead of scanning the whole table
+        self.tenant_metadata_table.add_global_secondary_index(
+            index_name=TENANT_TIER_INDEX_NAME,
+            partition_key=dynamodb.Attribute(
+                name="tenant_tier",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="tenant_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL
+        )
+
+        # Create Amazon DynamoDB Table for the request counts shared by the authorizers,
+        # counters expire shortly after their window
+        self.rate_limit_table = dynamodb.Table(self, "RateLimitTable",
+            partition_key=dynamodb.Attribute(
+                name="counter_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # Create Amazon DynamoDB Table for the status of asynchronous registrations
+        self.registration_status_table = dynamodb.Table(self, "RegistrationStatusTable",
+            partition_key=dynamodb.Attribute(
+                name="tracking_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
     @property
     def table_obj(self) -> dynamodb.Table:
         return self.tenant_metadata_table
@@ -34,3 +74,23 @@ class DataStack(Stack):
     @property
     def table_arn(self) -> str:
         return self.tenant_metadata_table.table_arn
+
+    @property
+    def tier_index_name(self) -> str:
+        return TENANT_TIER_INDEX_NAME
+
+    @property
+    def status_table_obj(self) -> dynamodb.Table:
+        return self.registration_status_table
+
+    @property
+    def status_table_name(self) -> str:
+        return self.registration_status_table.table_name
+
+    @property
+    def rate_limit_table_obj(self) -> dynamodb.Table:
+        return self.rate_limit_table
+
+    @property
+    def rate_limit_table_name(self) -> str:
+        return self.rate_limit_table.table_name
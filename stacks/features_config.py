@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Feature flags deployed to the AppConfig hosted configuration store. Kept free of
+# CDK imports so that local tools and benchmarks can load it.
+FEATURES_CONFIG = {
+    "analytics": {
+        "default": False,
+        "rules": {
+            "customer tier equals basic or premium": {
+                "when_match": True,
+                "conditions": [{"action": "KEY_IN_VALUE", "key": "tier", "value": ["basic", "premium"]}],
+            }
+        },
+    },
+    "crm": {
+        "default": False,
+        "rules": {
+            "customer tier equals basic or premium": {
+                "when_match": True,
+                "conditions": [{"action": "KEY_IN_VALUE", "key": "tier", "value": ["basic", "premium"]}],
+            }
+        },
+    },
+    "email": {
+        "default": False,
+        "rules": {
+            "customer tier equals premium": {
+                "when_match": True,
+                "conditions": [{"action": "EQUALS", "key": "tier", "value": "premium"}],
+            }
+        },
+    }
+}
+
+# Request rate limits deployed to a second AppConfig profile. `tenant_limits` are the
+# requests per second and burst of each tenant, enforced by the authorizer and read
+# at run time. `tier_limits` are the requests per second and burst of all the tenants
+# of a tier together, applied by the API Gateway usage plans when the stack is
+# deployed. Tiers without limits get those of `default_tier`.
+RATE_LIMITS_CONFIG = {
+    "default_tier": "basic",
+    "tenant_limits": {
+        "basic": {"rate": 5, "burst": 10},
+        "premium": {"rate": 50, "burst": 100},
+    },
+    "tier_limits": {
+        "basic": {"rate": 200, "burst": 400},
+        "premium": {"rate": 1000, "burst": 2000},
+    },
+}
@@ -5,13 +5,19 @@ from aws_cdk import (
     Stack,
     CfnOutput,
     RemovalPolicy,
-    aws_cognito as cognito
+    aws_cognito as cognito,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+    aws_lambda_python_alpha as pylambda
 )
 from constructs import Construct
 
+from stacks.data_stack import DataStack
+from stacks.layers import powertools_layer, shared_layer
+
 class IdentityStack(Stack):
 
-    def __init__(self, scope: Construct, id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str, data_stack: DataStack, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
         # Create a new Amazon Cognito Userpool
@@ -40,6 +46,29 @@ class IdentityStack(Stack):
         )
         self.user_pool.apply_removal_policy(RemovalPolicy.DESTROY)
 
+        # Pre token generation trigger, adds the tenant name, tier and full name of the
+        # user to the ID token so the authorizer can skip the tenant metadata lookup
+        self.pre_token_role = iam.Role(self, "PreTokenLambdaRole",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]
+        )
+        self.pre_token_role.apply_removal_policy(RemovalPolicy.DESTROY)
+        data_stack.table_obj.grant(self.pre_token_role, "dynamodb:GetItem")
+
+        self.pre_token_lambda = pylambda.PythonFunction(self, "PreTokenLambda",
+            role=self.pre_token_role,
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            entry="backend/pre_token",
+            index="pre_token.py",
+            handler="lambda_handler",
+            layers=[powertools_layer(self, self.region), shared_layer(self)],
+            environment={
+                "TENANT_METADATA_TABLE_NAME": data_stack.table_name
+            }
+        )
+        self.pre_token_lambda.apply_removal_policy(RemovalPolicy.DESTROY)
+        self.user_pool.add_trigger(cognito.UserPoolOperation.PRE_TOKEN_GENERATION, self.pre_token_lambda)
+
         # Create an App Client for the User Pool
         self.user_pool_client = self.user_pool.add_client("UserPoolClient",
             o_auth=cognito.OAuthSettings(
@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from aws_cdk import (
+    RemovalPolicy,
+    aws_lambda as _lambda,
+    aws_lambda_python_alpha as pylambda,
+)
+from constructs import Construct
+
+POWERTOOLS_ARN = 'arn:aws:lambda:{}:017000801446:layer:AWSLambdaPowertoolsPythonV2:20'
+
+
+def powertools_layer(scope: Construct, region: str) -> _lambda.ILayerVersion:
+    return _lambda.LayerVersion.from_layer_version_arn(scope, "PowerTools", POWERTOOLS_ARN.format(region))
+
+
+def shared_layer(scope: Construct) -> pylambda.PythonLayerVersion:
+    # Code shared by the backend functions (pooled HTTP client, metrics and logging helpers)
+    layer = pylambda.PythonLayerVersion(scope, "SharedLayer",
+        entry="backend/shared",
+        compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
+        compatible_architectures=[_lambda.Architecture.X86_64, _lambda.Architecture.ARM_64]
+    )
+    layer.apply_removal_policy(RemovalPolicy.DESTROY)
+    return layer
@@ -0,0 +1,147 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import jsii
+from aws_cdk import Stack, Token
+from constructs import IValidation
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """Capacity and latency settings of the backend functions and API, selected with
+    `cdk deploy -c performance_profile=<name>`."""
+    name: str
+    # MB, also scales the CPU share of the functions
+    authorizer_memory_size: int
+    features_memory_size: int
+    register_memory_size: int
+    # "arm64" or "x86_64"
+    architecture: str
+    # pre-initialized execution environments, 0 for none
+    authorizer_provisioned_concurrency: int
+    features_provisioned_concurrency: int
+    # seconds API Gateway caches the authorizer policy per token, 0 disables the cache
+    authorizer_cache_ttl: int
+    # steady-state requests per second and burst of the API stage, None for the account defaults
+    throttling_rate_limit: Optional[float] = None
+    throttling_burst_limit: Optional[int] = None
+
+
+PROFILES = {
+    profile.name: profile for profile in (
+        PerformanceProfile(
+            name="dev",
+            authorizer_memory_size=128,
+            features_memory_size=128,
+            register_memory_size=128,
+            architecture="x86_64",
+            authorizer_provisioned_concurrency=0,
+            features_provisioned_concurrency=0,
+            authorizer_cache_ttl=300
+        ),
+        PerformanceProfile(
+            name="standard",
+            authorizer_memory_size=512,
+            features_memory_size=512,
+            register_memory_size=256,
+            architecture="arm64",
+            authorizer_provisioned_concurrency=0,
+            features_provisioned_concurrency=0,
+            authorizer_cache_ttl=300,
+            throttling_rate_limit=500,
+            throttling_burst_limit=1000
+        ),
+        PerformanceProfile(
+            name="high-throughput",
+            authorizer_memory_size=1024,
+            features_memory_size=1024,
+            register_memory_size=512,
+            architecture="arm64",
+            authorizer_provisioned_concurrency=10,
+            features_provisioned_concurrency=10,
+            authorizer_cache_ttl=3600,
+            throttling_rate_limit=5000,
+            throttling_burst_limit=10000
+        ),
+    )
+}
+
+DEFAULT_PROFILE = "dev"
+
+
+def get_profile(name: Optional[str]) -> PerformanceProfile:
+    try:
+        return PROFILES[name or DEFAULT_PROFILE]
+    except KeyError:
+        raise ValueError(f"Unknown performance profile {name}, expected one of {', '.join(PROFILES)}") from None
+
+
+def _resolved(stack: Stack, value):
+    # properties of L1 constructs may hold tokens or IResolvable wrappers
+    return stack.resolve(value) if Token.is_unresolved(value) else value
+
+
+def _field(struct, name: str):
+    """Reads `name` from an L1 property struct, or from its resolved dictionary form."""
+    if struct is None:
+        return None
+    if isinstance(struct, dict):
+        camel = re.sub(r"_(\w)", lambda match: match.group(1).upper(), name)
+        return struct.get(camel, struct.get(camel[0].upper() + camel[1:]))
+    return getattr(struct, name, None)
+
+
+@jsii.implements(IValidation)
+class ProfileValidation:
+    """Checks at synth time that the resources of the backend stack carry the settings
+    of the selected performance profile."""
+
+    def __init__(self, stack, profile: PerformanceProfile):
+        self.stack = stack
+        self.profile = profile
+
+    def validate(self) -> List[str]:
+        stack, profile = self.stack, self.profile
+        errors = []
+
+        def expect(what, actual, expected):
+            actual = _resolved(stack, actual)
+            if actual != expected:
+                errors.append(f"Performance profile {profile.name}: {what} is {actual}, expected {expected}")
+
+        for function, memory_size, architecture in (
+            (stack.authorizer_lambda, profile.authorizer_memory_size, profile.architecture),
+            (stack.features_lambda, profile.features_memory_size, stack.features_architecture.name),
+            (stack.register_lambda, profile.register_memory_size, profile.architecture),
+            (stack.register_worker_lambda, profile.register_memory_size, profile.architecture),
+        ):
+            cfn_function = function.node.default_child
+            expect(f"{function.node.id} memory size", cfn_function.memory_size, memory_size)
+            expect(f"{function.node.id} architecture", cfn_function.architectures or ["x86_64"], [architecture])
+
+        for alias, provisioned_concurrency in (
+            (stack.authorizer_alias, profile.authorizer_provisioned_concurrency),
+            (stack.features_alias, profile.features_provisioned_concurrency),
+        ):
+            config = _resolved(stack, alias.node.default_child.provisioned_concurrency_config)
+            actual = _field(config, "provisioned_concurrent_executions") or 0
+            expect(f"{alias.node.id} provisioned concurrency", actual, provisioned_concurrency)
+
+        # per tenant rate limits need the authorizer to run for every request
+        expected_cache_ttl = 0 if stack.tenant_rate_limits else profile.authorizer_cache_ttl
+        expect("authorizer cache TTL", stack.authorizer.node.default_child.authorizer_result_ttl_in_seconds, expected_cache_ttl)
+
+        method_settings = _resolved(stack, stack.api.deployment_stage.node.default_child.method_settings) or []
+        throttling = next((setting for setting in method_settings if _field(setting, "resource_path") == "/*"), None)
+        expect("stage throttling rate limit", _field(throttling, "throttling_rate_limit"), profile.throttling_rate_limit)
+        expect("stage throttling burst limit", _field(throttling, "throttling_burst_limit"), profile.throttling_burst_limit)
+
+        if not 128 <= min(profile.authorizer_memory_size, profile.features_memory_size, profile.register_memory_size):
+            errors.append(f"Performance profile {profile.name}: memory sizes must be at least 128 MB")
+        if not 0 <= profile.authorizer_cache_ttl <= 3600:
+            errors.append(f"Performance profile {profile.name}: authorizer cache TTL must be between 0 and 3600 seconds")
+        return errors
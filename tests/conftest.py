@@ -0,0 +1,11 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the functions import their modules and the shared layer by module name, as in Lambda
+for path in ("backend/shared", "backend/features", "backend/register"):
+    sys.path.insert(0, os.path.join(ROOT, path))
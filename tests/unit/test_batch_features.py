@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+
+from batch_features import BatchEvaluator
+
+TIER_CONFIG = {
+    "reports": {"default": False, "rules": {"premium": {"when_match": True, "conditions": [
+        {"action": "EQUALS", "key": "tier", "value": "premium"}
+    ]}}}
+}
+PILOT_CONFIG = {
+    "beta": {"default": False, "rules": {"pilot tenants": {"when_match": True, "conditions": [
+        {"action": "KEY_IN_VALUE", "key": "tenant_id", "value": ["t-pilot"]}
+    ]}}}
+}
+
+
+def run(config, contexts):
+    evaluator = BatchEvaluator(config)
+    lines = [json.dumps(context) if isinstance(context, dict) else context for context in contexts]
+    return evaluator, [json.loads(result) for result in evaluator.iter_results(lines)]
+
+
+def test_tenants_of_a_tier_are_evaluated_once():
+    evaluator, results = run(TIER_CONFIG, [
+        {"tenant_id": "t-1", "tier": "premium"},
+        {"tenant_id": "t-2", "tier": "premium"},
+        {"tenant_id": "t-3", "tier": "basic"},
+    ])
+    assert [result["features"] for result in results] == [["reports"], ["reports"], []]
+    assert results[1]["tenant_id"] == "t-2"
+    assert evaluator.evaluations == 2
+
+
+def test_conditions_on_tenant_are_evaluated_per_tenant():
+    evaluator, results = run(PILOT_CONFIG, [
+        {"tenant_id": "t-pilot", "tier": "basic"},
+        {"tenant_id": "t-other", "tier": "basic"},
+        {"tenant_id": "t-pilot", "tier": "basic"},
+    ])
+    assert [result["features"] for result in results] == [["beta"], [], ["beta"]]
+    assert evaluator.evaluations == 2
+
+
+def test_invalid_lines_are_reported_and_the_batch_continues():
+    _, results = run(TIER_CONFIG, [
+        "not json",
+        "[1]",
+        {"tier": ["premium"]},
+        {"tenant_id": "t-1", "tier": "premium"},
+    ])
+    assert [result.get("line") for result in results[:3]] == [1, 2, 3]
+    assert all("error" in result for result in results[:3])
+    assert results[3]["features"] == ["reports"]
@@ -0,0 +1,50 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import subprocess
+
+from aws_cdk import App
+
+from snapshot_store import SnapshotStoreProvider
+from stacks.backend_stack import BackendStack, BundledSnapshot
+from stacks.config_stack import ConfigStack
+from stacks.data_stack import DataStack
+from stacks.features_config import FEATURES_CONFIG
+from stacks.identity_stack import IdentityStack
+
+STACK_ENV = {"region": "us-east-1"}
+
+
+def test_bundling_writes_the_configuration_snapshot(tmp_path):
+    hooks = BundledSnapshot(FEATURES_CONFIG)
+    assert hooks.before_bundling("/asset-input", str(tmp_path)) == []
+    for command in hooks.after_bundling("/asset-input", str(tmp_path)):
+        subprocess.run(command, shell=True, check=True)
+
+    store = SnapshotStoreProvider([str(tmp_path / BundledSnapshot.FILE_NAME)])
+    # same features and rules, in the same order
+    assert json.dumps(store.get_configuration()) == json.dumps(FEATURES_CONFIG)
+    assert store.config_version.startswith("bundled-")
+
+
+def test_version_follows_the_configuration():
+    changed = {**FEATURES_CONFIG, "new_feature": {"default": False}}
+    assert BundledSnapshot(FEATURES_CONFIG).snapshot == BundledSnapshot(dict(FEATURES_CONFIG)).snapshot
+    assert BundledSnapshot(FEATURES_CONFIG).snapshot.split("\n")[0] != BundledSnapshot(changed).snapshot.split("\n")[0]
+
+
+def test_synth_leaves_the_source_tree_alone():
+    app = App(context={"config_store": "layered", "aws:cdk:bundling-stacks": []})
+    data_stack = DataStack(app, "DataStack", env=STACK_ENV)
+    identity_stack = IdentityStack(app, "IdentityStack", data_stack=data_stack, env=STACK_ENV)
+    config_stack = ConfigStack(app, "ConfigStack", env=STACK_ENV)
+    BackendStack(app, "BackendStack",
+        identity_stack=identity_stack,
+        config_stack=config_stack,
+        data_stack=data_stack,
+        env=STACK_ENV
+    )
+    app.synth()
+    assert not os.path.exists(os.path.join("backend", "features", BundledSnapshot.FILE_NAME))
@@ -0,0 +1,119 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import copy
+import json
+import random
+
+import pytest
+from aws_lambda_powertools.utilities.feature_flags.feature_flags import FeatureFlags
+
+from batch_features import StaticStoreProvider
+from compiled_flags import CompiledFeatureFlags
+
+TIERS = ["basic", "standard", "premium"]
+# a tier no rule names, filled on first use
+CONTEXT_TIERS = TIERS + ["trial"]
+
+
+def random_feature(rng: random.Random) -> dict:
+    feature = {"default": rng.random() < 0.3}
+    if rng.random() < 0.8:
+        feature["rules"] = {
+            f"rule {index}": {
+                "when_match": rng.random() < 0.7,
+                "conditions": [rng.choice([
+                    {"action": "EQUALS", "key": "tier", "value": rng.choice(TIERS)},
+                    {"action": "NOT_EQUALS", "key": "tier", "value": rng.choice(TIERS)},
+                    {"action": "KEY_IN_VALUE", "key": "tier", "value": rng.sample(TIERS, 2)},
+                    {"action": "KEY_NOT_IN_VALUE", "key": "tier", "value": rng.sample(TIERS, 2)},
+                ]) for _ in range(rng.randint(1, 2))]
+            } for index in range(rng.randint(1, 3))
+        }
+    return feature
+
+
+def random_config(rng: random.Random) -> dict:
+    return {f"feature{index}": random_feature(rng) for index in range(rng.randint(1, 12))}
+
+
+def change_config(rng: random.Random, config: dict, step: int) -> dict:
+    config = copy.deepcopy(config)
+    names = list(config)
+    operation = rng.choice(["change", "remove", "add", "reorder features", "reorder rules"])
+    if operation == "change" and names:
+        config[rng.choice(names)] = random_feature(rng)
+    elif operation == "remove" and names:
+        del config[rng.choice(names)]
+    elif operation == "add":
+        config[f"new{step}"] = random_feature(rng)
+    elif operation == "reorder features":
+        items = list(config.items())
+        rng.shuffle(items)
+        config = dict(items)
+    elif operation == "reorder rules" and names:
+        feature = config[rng.choice(names)]
+        items = list(feature.get("rules", {}).items())
+        rng.shuffle(items)
+        if items:
+            feature["rules"] = dict(items)
+    return config
+
+
+def assert_same_features(compiled: CompiledFeatureFlags, feature_flags: FeatureFlags):
+    for tier in CONTEXT_TIERS:
+        context = {"tier": tier}
+        expected = feature_flags.get_enabled_features(context=context)
+        # same features in the same order, so the response body and its ETag do not
+        # depend on which engine answered
+        assert compiled.get_enabled_features(context=context) == expected
+        assert compiled.get_enabled_features_json(context=context) == json.dumps(expected)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_compiled_table_matches_rule_engine(seed):
+    store = StaticStoreProvider(random_config(random.Random(seed)))
+    feature_flags = FeatureFlags(store=store)
+    assert_same_features(CompiledFeatureFlags(feature_flags=feature_flags, store=store), feature_flags)
+
+
+@pytest.mark.parametrize("versioned", [True, False], ids=["versioned", "unversioned"])
+@pytest.mark.parametrize("seed", range(40))
+def test_incremental_recompile_matches_rule_engine(seed, versioned):
+    rng = random.Random(seed)
+    config = random_config(rng)
+    store = StaticStoreProvider(config, "0" if versioned else None)
+    feature_flags = FeatureFlags(store=store)
+    compiled = CompiledFeatureFlags(feature_flags=feature_flags, store=store)
+    assert_same_features(compiled, feature_flags)
+
+    for step in range(1, 16):
+        config = change_config(rng, config, step)
+        store.config = config
+        if versioned:
+            store.config_version = str(step)
+        assert_same_features(compiled, feature_flags)
+
+
+def test_reordered_rules_are_recompiled():
+    first = {"when_match": True, "conditions": [{"action": "EQUALS", "key": "tier", "value": "premium"}]}
+    second = {"when_match": False, "conditions": [{"action": "KEY_IN_VALUE", "key": "tier", "value": ["premium"]}]}
+    store = StaticStoreProvider({"reports": {"default": False, "rules": {"first": first, "second": second}}}, "1")
+    compiled = CompiledFeatureFlags(feature_flags=FeatureFlags(store=store), store=store)
+    assert compiled.get_enabled_features(context={"tier": "premium"}) == ["reports"]
+
+    store.config = {"reports": {"default": False, "rules": {"second": second, "first": first}}}
+    store.config_version = "2"
+    assert compiled.get_enabled_features(context={"tier": "premium"}) == []
+
+
+def test_non_tier_conditions_use_rule_engine():
+    config = {
+        "beta": {"default": False, "rules": {"pilot": {"when_match": True, "conditions": [
+            {"action": "KEY_IN_VALUE", "key": "tenant_id", "value": ["t-pilot"]}
+        ]}}}
+    }
+    store = StaticStoreProvider(config, "1")
+    compiled = CompiledFeatureFlags(feature_flags=FeatureFlags(store=store), store=store)
+    assert compiled.get_enabled_features(context={"tier": "basic", "tenant_id": "t-pilot"}) == ["beta"]
+    assert compiled.get_enabled_features(context={"tier": "basic", "tenant_id": "t-other"}) == []
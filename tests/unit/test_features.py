@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+
+import pytest
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('CONFIG_APP_NAME', 'app')
+os.environ.setdefault('CONFIG_ENV_NAME', 'env')
+os.environ.setdefault('CONFIG_PROFILE_NAME', 'features')
+
+from aws_lambda_powertools.utilities.feature_flags.feature_flags import FeatureFlags
+
+import features
+from batch_features import StaticStoreProvider
+from compiled_flags import CompiledFeatureFlags
+from phase_timer import PhaseTimer
+
+PILOT_CONFIG = {
+    "reports": {"default": True},
+    "beta": {"default": False, "rules": {"pilot tenants": {"when_match": True, "conditions": [
+        {"action": "KEY_IN_VALUE", "key": "tenant_id", "value": ["t-pilot"]}
+    ]}}}
+}
+TIER_CONFIG = {
+    "reports": {"default": False, "rules": {"premium": {"when_match": True, "conditions": [
+        {"action": "EQUALS", "key": "tier", "value": "premium"}
+    ]}}}
+}
+
+
+@pytest.fixture
+def use_config(monkeypatch):
+    def use(config):
+        store = StaticStoreProvider(config, "1")
+        monkeypatch.setattr(features, "compiled_flags", CompiledFeatureFlags(feature_flags=FeatureFlags(store=store), store=store))
+        features.response_cache.clear()
+    return use
+
+
+def get_features(tenant_id, tier="basic"):
+    event = {"requestContext": {"authorizer": {
+        "tenant_id": tenant_id, "tenant_name": f"{tenant_id} name", "tenant_tier": tier, "fullname": "Jane Doe"
+    }}}
+    return json.loads(features.get_features(event, PhaseTimer())["body"])["features"]
+
+
+def test_conditions_on_tenant_are_not_shared_by_the_tier(use_config):
+    use_config(PILOT_CONFIG)
+    assert get_features("t-pilot") == ["reports", "beta"]
+    assert get_features("t-other") == ["reports"]
+    assert features.response_cache.version is None
+
+
+def test_tier_only_configuration_is_cached_per_tier(use_config):
+    use_config(TIER_CONFIG)
+    assert get_features("t-1", "premium") == ["reports"]
+    assert get_features("t-2", "premium") == ["reports"]
+    assert get_features("t-3", "basic") == []
+    assert features.response_cache.get("1", "premium") is not None
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import pytest
+from aws_cdk import App
+from aws_cdk.assertions import Template
+
+from stacks.backend_stack import BackendStack
+from stacks.config_stack import ConfigStack
+from stacks.data_stack import DataStack
+from stacks.identity_stack import IdentityStack
+from stacks.performance_profiles import PROFILES
+
+STACK_ENV = {"region": "us-east-1"}
+
+
+def synth_backend(profile_name: str) -> Template:
+    # no stack is bundled, the functions get placeholder assets and Docker is not needed
+    app = App(context={"performance_profile": profile_name, "aws:cdk:bundling-stacks": []})
+    data_stack = DataStack(app, "DataStack", env=STACK_ENV)
+    identity_stack = IdentityStack(app, "IdentityStack", data_stack=data_stack, env=STACK_ENV)
+    config_stack = ConfigStack(app, "ConfigStack", env=STACK_ENV)
+    backend_stack = BackendStack(app, "BackendStack",
+        identity_stack=identity_stack,
+        config_stack=config_stack,
+        data_stack=data_stack,
+        env=STACK_ENV
+    )
+    # runs the ProfileValidation of the backend stack
+    app.synth()
+    return Template.from_stack(backend_stack)
+
+
+@pytest.mark.parametrize("profile", PROFILES.values(), ids=list(PROFILES))
+def test_profile_synthesizes_with_its_settings(profile):
+    template = synth_backend(profile.name)
+
+    for handler, memory_size in (
+        ("authorizer.lambda_handler", profile.authorizer_memory_size),
+        ("features.lambda_handler", profile.features_memory_size),
+        ("register.lambda_handler", profile.register_memory_size),
+        ("worker.lambda_handler", profile.register_memory_size),
+    ):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "MemorySize": memory_size
+        })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "authorizer.lambda_handler",
+        "Architectures": [profile.architecture]
+    })
+    # the features function stays on x86_64 without the arm64 AppConfig extension layer
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "features.lambda_handler",
+        "Architectures": ["x86_64"]
+    })
+
+    concurrencies = {profile.authorizer_provisioned_concurrency, profile.features_provisioned_concurrency}
+    aliases = template.find_resources("AWS::Lambda::Alias")
+    assert len(aliases) == 2
+    for alias in aliases.values():
+        config = alias["Properties"].get("ProvisionedConcurrencyConfig")
+        assert (config["ProvisionedConcurrentExecutions"] if config else 0) in concurrencies
+
+    template.has_resource_properties("AWS::ApiGateway::Authorizer", {
+        "AuthorizerResultTtlInSeconds": profile.authorizer_cache_ttl
+    })
+
+    stages = template.find_resources("AWS::ApiGateway::Stage")
+    assert len(stages) == 1
+    method_settings = next(iter(stages.values()))["Properties"].get("MethodSettings", [])
+    throttling = next((setting for setting in method_settings if setting.get("ResourcePath") == "/*"), {})
+    assert throttling.get("ThrottlingRateLimit") == profile.throttling_rate_limit
+    assert throttling.get("ThrottlingBurstLimit") == profile.throttling_burst_limit
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        synth_backend("unknown")
@@ -0,0 +1,214 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('USER_POOL_ID', 'us-east-1_pool')
+os.environ.setdefault('TENANT_METADATA_TABLE_NAME', 'TenantMetadata')
+
+import register
+import worker
+from registration_queue import InMemoryRegistrationQueue, InMemoryStatusStore, FAILED, QUEUED, REGISTERED, USER_CREATED
+
+REGISTRATION = {
+    'email': 'jane@example.com',
+    'given_name': 'Jane',
+    'family_name': 'Doe',
+    'tenant_name': 'Example',
+    'tenant_tier': 'premium'
+}
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Operation')
+
+
+class FakeCognito:
+    """User pool holding users in memory. `failures` lists errors raised by the next
+    AdminCreateUser calls, `fail_after_create` the ones raised once the user exists."""
+
+    def __init__(self):
+        self.users = {}
+        self.create_calls = 0
+        self.failures = []
+        self.fail_after_create = []
+
+    def admin_create_user(self, UserPoolId, Username, UserAttributes):
+        self.create_calls += 1
+        if self.failures:
+            raise client_error(self.failures.pop(0))
+        if Username in self.users:
+            raise client_error('UsernameExistsException')
+        self.users[Username] = {attribute['Name']: attribute['Value'] for attribute in UserAttributes}
+        if self.fail_after_create:
+            raise client_error(self.fail_after_create.pop(0))
+
+    def admin_get_user(self, UserPoolId, Username):
+        attributes = self.users[Username]
+        return {'Username': Username, 'UserAttributes': [{'Name': name, 'Value': value} for name, value in attributes.items()]}
+
+    def admin_delete_user(self, UserPoolId, Username):
+        del self.users[Username]
+
+
+class FakeTable:
+    def __init__(self):
+        self.items = {}
+        self.failures = []
+
+    def put_item(self, Item, ConditionExpression=None):
+        if self.failures:
+            raise client_error(self.failures.pop(0))
+        if ConditionExpression and Item['tenant_id'] in self.items:
+            raise client_error('ConditionalCheckFailedException')
+        self.items[Item['tenant_id']] = Item
+
+    def batch_writer(self):
+        return BatchWriter(self)
+
+
+class BatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+
+class FlakyStatusStore(InMemoryStatusStore):
+    """Status store whose writes of the statuses in `failures` fail once."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = list(failures)
+
+    def put(self, tracking_id, status, **fields):
+        if status in self.failures:
+            self.failures.remove(status)
+            raise client_error('ThrottlingException')
+        super().put(tracking_id, status, **fields)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    cognito, table, queue = FakeCognito(), FakeTable(), InMemoryRegistrationQueue()
+    monkeypatch.setattr(register, 'cognito', cognito)
+    monkeypatch.setattr(register, 'tenant_metadata_table', table)
+    monkeypatch.setattr(register, 'registration_queue', queue)
+    monkeypatch.setattr(register, 'registration_status', InMemoryStatusStore())
+    monkeypatch.setattr(register, '_clients_initialized', True)
+    monkeypatch.setattr(register, 'ASYNC_REGISTRATION', True)
+    monkeypatch.setattr(register, 'BULK_MAX_ATTEMPTS', 1)
+    return cognito, table, queue
+
+
+def submit(registration=REGISTRATION) -> str:
+    response = register.lambda_handler({'httpMethod': 'POST', 'body': json.dumps(registration)}, None)
+    assert response['statusCode'] == 202
+    return json.loads(response['body'])['tracking_id']
+
+
+def get_status(tracking_id: str) -> dict:
+    response = register.lambda_handler({'httpMethod': 'GET', 'pathParameters': {'tracking_id': tracking_id}}, None)
+    return json.loads(response['body']) if response['statusCode'] == 200 else None
+
+
+def test_queued_registration_is_processed(backend):
+    cognito, table, queue = backend
+    tracking_id = submit()
+    assert get_status(tracking_id)['status'] == QUEUED
+
+    assert worker.drain(queue) == 1
+    assert get_status(tracking_id)['status'] == REGISTERED
+    tenant_id = cognito.users[REGISTRATION['email']]['custom:tenant_id']
+    assert table.items[tenant_id]['tenant_tier'] == 'premium'
+
+
+def test_unknown_tracking_id_is_not_found(backend):
+    assert get_status('unknown') is None
+
+
+def test_duplicate_delivery_registers_once(backend):
+    cognito, table, queue = backend
+    tracking_id = submit()
+    message = json.loads(queue.receive()[0]['body'])
+    queue.send(message)
+    queue.send(message)
+
+    worker.drain(queue, batch_size=1)
+    assert get_status(tracking_id)['status'] == REGISTERED
+    assert cognito.create_calls == 1
+    assert len(table.items) == 1
+
+
+def test_retryable_error_is_delivered_again(backend):
+    cognito, table, queue = backend
+    cognito.failures = ['TooManyRequestsException']
+    tracking_id = submit()
+
+    assert worker.drain(queue) == 2
+    assert get_status(tracking_id)['status'] == REGISTERED
+    assert len(cognito.users) == 1 and len(table.items) == 1
+
+
+def test_user_created_by_an_unrecorded_delivery_is_reused(backend, monkeypatch):
+    cognito, table, queue = backend
+    # the user is created but the USER_CREATED status is not written
+    monkeypatch.setattr(register, 'registration_status', FlakyStatusStore([USER_CREATED]))
+    tracking_id = submit()
+
+    assert worker.drain(queue) == 2
+    assert get_status(tracking_id)['status'] == REGISTERED
+    tenant_id = cognito.users[REGISTRATION['email']]['custom:tenant_id']
+    assert list(table.items) == [tenant_id]
+
+
+def test_user_is_removed_when_the_metadata_cannot_be_written(backend):
+    cognito, table, queue = backend
+    table.failures = ['ValidationException']
+    tracking_id = submit()
+
+    worker.drain(queue)
+    status = get_status(tracking_id)
+    assert status['status'] == FAILED and 'ValidationException' in status['error']
+    assert cognito.users == {}
+
+    # the same registration can be submitted again
+    tracking_id = submit()
+    worker.drain(queue)
+    assert get_status(tracking_id)['status'] == REGISTERED
+
+
+def test_existing_user_of_another_registration_is_kept(backend):
+    cognito, table, queue = backend
+    cognito.users[REGISTRATION['email']] = {'custom:tenant_id': 'another-tenant'}
+    tracking_id = submit()
+
+    worker.drain(queue)
+    assert get_status(tracking_id)['status'] == FAILED
+    assert cognito.users[REGISTRATION['email']] == {'custom:tenant_id': 'another-tenant'}
+    assert table.items == {}
+
+
+def test_bulk_retry_after_the_user_was_created(backend, monkeypatch):
+    cognito, table, queue = backend
+    monkeypatch.setattr(register, 'BULK_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(register.time, 'sleep', lambda seconds: None)
+    # the first call creates the user, then fails
+    cognito.fail_after_create = ['InternalErrorException']
+
+    result = register._register_bulk([REGISTRATION], None)
+    assert result['results'][0]['status'] == 'registered'
+    assert result['results'][0]['attempts'] == 2
+
@@ -0,0 +1,306 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""Parallel report and tier migration over the tenant metadata table.
+
+Without --tier the whole table is read with a parallel segmented Scan: the table is
+split into --segments segments, read concurrently by --workers threads. With --tier
+each listed tier is read with a Query on the tenant tier index, the tiers in
+parallel. Items are written as JSON lines to --output (standard output by default)
+as the pages arrive, so memory use does not grow with the table.
+
+    python -m tools.tenant_scan --table <name> --segments 32 --workers 16 --output tenants.jsonl
+    python -m tools.tenant_scan --table <name> --tier basic --tier premium
+    python -m tools.tenant_scan --table <name> --tier basic --migrate-to premium --checkpoint migration.json
+
+With --checkpoint the position of every segment or tier is saved as the pages are
+written, and running the same command again resumes where it stopped, appending to
+the output. A page may be written twice when the command is interrupted between
+writing it and saving the checkpoint.
+
+--migrate-to moves every tenant read to another tier. Each update is conditional
+on the tier the tenant was read with, so a resumed migration or a concurrent tier
+change is never overwritten. The authorizer picks up the new tier when its cached
+tenant record expires, or, when it trusts the tenant claims of the tokens
+(TRUST_TOKEN_CLAIMS), when the users' ID tokens are refreshed.
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+TENANT_TIER_INDEX_NAME = 'TenantTierIndex'
+# seconds between checkpoint writes, the checkpoint is always written on exit
+CHECKPOINT_INTERVAL = 2.0
+
+
+class Checkpoint:
+    """Position of each segment or tier, saved atomically to a JSON file.
+
+    Only the thread writing the output updates it, after the items of a page are
+    written, so a resumed run never skips an item."""
+
+    def __init__(self, path: Optional[str], job: Dict[str, Any]):
+        self.path = path
+        self.job = job
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.resumed = False
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            if saved['job'] != job:
+                raise SystemExit(f"Checkpoint {path} was written by a run with other arguments: {saved['job']}")
+            self.positions = saved['positions']
+            self.resumed = True
+
+    def start_key(self, stream: str) -> Optional[Dict[str, Any]]:
+        return self.positions.get(stream, {}).get('last_key')
+
+    def is_done(self, stream: str) -> bool:
+        return self.positions.get(stream, {}).get('done', False)
+
+    def update(self, stream: str, last_key: Optional[Dict[str, Any]]):
+        self.positions[stream] = {'last_key': last_key, 'done': last_key is None}
+        self.save()
+
+    def save(self, force: bool = False):
+        if not self.path or (not force and time.monotonic() - self._saved_at < CHECKPOINT_INTERVAL):
+            return
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({'job': self.job, 'positions': self.positions}, checkpoint_file, default=_json_default)
+        os.replace(temporary_path, self.path)
+        self._saved_at = time.monotonic()
+
+
+class _RateLimiter:
+    """Spaces calls evenly so that at most `rate` calls per second start, across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class TenantScan:
+    """Reads the tenant table by segment or by tier from a pool of threads, and hands
+    each page to the calling thread through a bounded queue."""
+
+    def __init__(self, table_name: str, region: Optional[str], workers: int, segments: int,
+                 tiers: List[str], index_name: str, page_size: Optional[int],
+                 migrate_to: Optional[str] = None, max_writes_per_second: Optional[float] = None):
+        self.table_name = table_name
+        self.region = region
+        self.workers = workers
+        self.tiers = tiers
+        self.index_name = index_name
+        self.page_size = page_size
+        self.migrate_to = migrate_to
+        self.limiter = _RateLimiter(max_writes_per_second) if max_writes_per_second else None
+        # one stream per scan segment, or per tier
+        self.streams = [f'tier:{tier}' for tier in tiers] if tiers else [f'segment:{segment}' for segment in range(segments)]
+        self.segments = segments
+        # boto3 resources are not thread-safe, each worker thread gets its own
+        self._local = threading.local()
+        self._config = Config(max_pool_connections=workers, retries={'mode': 'adaptive', 'max_attempts': 10})
+
+    @property
+    def job(self) -> Dict[str, Any]:
+        """Arguments a checkpoint is only valid for."""
+        return {
+            'table': self.table_name,
+            'streams': self.streams,
+            'index': self.index_name if self.tiers else None,
+            'migrate_to': self.migrate_to,
+        }
+
+    def run(self, checkpoint: Checkpoint, write_page):
+        """Reads every stream not finished in `checkpoint`, calls `write_page(items)` for
+        each page from the calling thread, then records the page in `checkpoint`.
+        Returns the number of tenants migrated and skipped."""
+        pending = [stream for stream in self.streams if not checkpoint.is_done(stream)]
+        pages = queue.Queue(maxsize=self.workers * 2)
+        stop = threading.Event()
+        totals = {'migrated': 0, 'skipped': 0}
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tenant-scan')
+        try:
+            for stream in pending:
+                executor.submit(self._read_stream, stream, checkpoint.start_key(stream), pages, stop)
+            remaining = len(pending)
+            while remaining:
+                stream, items, last_key, counts, error = pages.get()
+                if error is not None:
+                    raise error
+                write_page(items)
+                for name, value in counts.items():
+                    totals[name] += value
+                checkpoint.update(stream, last_key)
+                if last_key is None:
+                    remaining -= 1
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            checkpoint.save(force=True)
+        return totals
+
+    def _table(self):
+        if not hasattr(self._local, 'table'):
+            session = boto3.session.Session()
+            self._local.table = session.resource('dynamodb', region_name=self.region, config=self._config).Table(self.table_name)
+        return self._local.table
+
+    def _read_stream(self, stream: str, start_key: Optional[Dict[str, Any]], pages: queue.Queue, stop: threading.Event):
+        try:
+            kind, _, value = stream.partition(':')
+            if kind == 'tier':
+                request = {
+                    'IndexName': self.index_name,
+                    'KeyConditionExpression': 'tenant_tier = :tier',
+                    'ExpressionAttributeValues': {':tier': value},
+                }
+                read = self._table().query
+            else:
+                request = {'Segment': int(value), 'TotalSegments': self.segments}
+                read = self._table().scan
+            if self.page_size:
+                request['Limit'] = self.page_size
+
+            while not stop.is_set():
+                if start_key:
+                    request['ExclusiveStartKey'] = start_key
+                response = read(**request)
+                items = response.get('Items', [])
+                counts = self._migrate(items) if self.migrate_to else {}
+                start_key = response.get('LastEvaluatedKey')
+                if not self._put(pages, (stream, items, start_key, counts, None), stop) or start_key is None:
+                    return
+        except Exception as e:
+            self._put(pages, (stream, [], None, {}, e), stop)
+
+    def _migrate(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        counts = {'migrated': 0, 'skipped': 0}
+        for item in items:
+            if item.get('tenant_tier') == self.migrate_to:
+                counts['skipped'] += 1
+                continue
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                self._table().update_item(
+                    Key={'tenant_id': item['tenant_id']},
+                    UpdateExpression='SET tenant_tier = :target',
+                    ConditionExpression='tenant_tier = :current',
+                    ExpressionAttributeValues={':target': self.migrate_to, ':current': item.get('tenant_tier')}
+                )
+                counts['migrated'] += 1
+            except ClientError as e:
+                # the tier changed since the item was read, or the index lagged behind the table
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                counts['skipped'] += 1
+        return counts
+
+    @staticmethod
+    def _put(pages: queue.Queue, message, stop: threading.Event) -> bool:
+        # a bounded queue slows the readers down to the speed of the output, and the
+        # timeout lets them notice when the run stops
+        while not stop.is_set():
+            try:
+                pages.put(message, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel report and tier migration over the tenant metadata table")
+    parser.add_argument('--table', required=True, help="name of the tenant metadata table")
+    parser.add_argument('--region', default=os.environ.get('AWS_DEFAULT_REGION'), help="region of the table")
+    parser.add_argument('--tier', action='append', default=[], help="query this tier through the index instead of scanning, may be repeated")
+    parser.add_argument('--index', default=TENANT_TIER_INDEX_NAME, help="name of the tenant tier index")
+    parser.add_argument('--segments', type=int, default=16, help="parallel scan segments")
+    parser.add_argument('--workers', type=int, default=8, help="reader threads")
+    parser.add_argument('--page-size', type=int, help="maximum items per request, 1 MB pages by default")
+    parser.add_argument('--output', default='-', help="JSON lines file, - for standard output")
+    parser.add_argument('--checkpoint', help="file to save progress to and resume from")
+    parser.add_argument('--migrate-to', help="move every tenant read to this tier, requires --tier")
+    parser.add_argument('--max-writes-per-second', type=float, help="limit the rate of tier updates")
+    args = parser.parse_args()
+
+    if args.migrate_to and not args.tier:
+        parser.error("--migrate-to requires --tier, to avoid moving every tenant of the table")
+    if args.segments < 1 or args.workers < 1:
+        parser.error("--segments and --workers must be at least 1")
+
+    scan = TenantScan(
+        table_name=args.table,
+        region=args.region,
+        workers=args.workers,
+        segments=args.segments,
+        tiers=args.tier,
+        index_name=args.index,
+        page_size=args.page_size,
+        migrate_to=args.migrate_to,
+        max_writes_per_second=args.max_writes_per_second
+    )
+    checkpoint = Checkpoint(args.checkpoint, scan.job)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'a' if checkpoint.resumed else 'w')
+    written = 0
+
+    def write_page(items):
+        nonlocal written
+        for item in items:
+            output.write(json.dumps(item, default=_json_default))
+            output.write('\n')
+        output.flush()
+        written += len(items)
+
+    start = time.perf_counter()
+    try:
+        totals = scan.run(checkpoint, write_page)
+    except KeyboardInterrupt:
+        print("Interrupted, rerun the same command to resume" if args.checkpoint else "Interrupted", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    summary = f"{written} tenants in {elapsed:.1f} s ({written / elapsed if elapsed else 0:.0f}/s)"
+    if args.migrate_to:
+        summary += f", {totals['migrated']} moved to {args.migrate_to}, {totals['skipped']} skipped"
+    print(summary, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()